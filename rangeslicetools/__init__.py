@@ -16,6 +16,14 @@ def _createWrapped(f: typing.Callable) -> typing.Callable:
 	return f1
 
 
+def _getReturnAnnotation(module, v) -> typing.Any:
+	"""Compiled modules (and postponed evaluation of annotations) store annotations as strings, so we resolve them against the module."""
+	ret = v.__annotations__["return"]
+	if isinstance(ret, str):
+		ret = module.__dict__.get(ret, ret)
+	return ret
+
+
 def _wrapModuleProp(module, k, v, all) -> None:
 	if k[0] != "_":
 		all.append(k)
@@ -25,7 +33,7 @@ def _wrapModuleProp(module, k, v, all) -> None:
 			raise ValueError("Annotate the return type in " + v.__qualname__ + "!")
 
 		modName = k[:-1]
-		if v.__annotations__["return"] is module.SliceRangeSeqT and modName not in module.__dict__:
+		if _getReturnAnnotation(module, v) is module.SliceRangeSeqT and modName not in module.__dict__:
 			module.__dict__[modName] = _createWrapped(v)
 			all.append(modName)
 
@@ -54,8 +62,15 @@ def _wrap(module) -> None:
 _wrap(utils)
 _wrap(diff)
 
+compiled = not utils.__file__.endswith(".py")
+
 # pylint: disable=wrong-import-position
 from .utils import *  # noqa
 from .diff import *  # noqa
+from .cache import *  # noqa
 from .tree import *  # noqa
+from .offsets import *  # noqa
+from .gaps import *  # noqa
 from .viz import *  # noqa
+from .partitioned import *  # noqa
+from .interop import *  # noqa
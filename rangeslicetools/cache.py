@@ -0,0 +1,57 @@
+import typing
+import threading
+from collections import OrderedDict
+
+__all__ = ("LRUCache",)
+
+
+class LRUCache:
+	"""A bounded mapping evicting the least recently used entries. Counts hits and misses. All the operations are serialized with a lock, so it can be shared between threads."""
+
+	__slots__ = ("maxSize", "hits", "misses", "_data", "_lock")
+
+	def __init__(self, maxSize: int = 1024) -> None:
+		self.maxSize = maxSize
+		self.hits = 0
+		self.misses = 0
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+		with self._lock:
+			try:
+				res = self._data[key]
+			except KeyError:
+				self.misses += 1
+				return default
+			self._data.move_to_end(key)
+			self.hits += 1
+			return res
+
+	def __setitem__(self, key: typing.Hashable, value: typing.Any) -> None:
+		with self._lock:
+			self._data[key] = value
+			self._data.move_to_end(key)
+			if len(self._data) > self.maxSize:
+				self._data.popitem(last=False)
+
+	def discardIf(self, pred: typing.Callable[[typing.Hashable], bool]) -> int:
+		"""Drops the entries which keys satisfy `pred`. Returns the count of the dropped entries."""
+		with self._lock:
+			toDrop = [k for k in self._data if pred(k)]
+			for k in toDrop:
+				del self._data[k]
+			return len(toDrop)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._data.clear()
+			self.hits = 0
+			self.misses = 0
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def stats(self) -> typing.Dict[str, int]:
+		with self._lock:
+			return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxSize": self.maxSize}
@@ -1,10 +1,15 @@
 import typing
+import heapq
+from math import gcd
+from itertools import groupby
 from enum import IntFlag
+from functools import wraps
 
-from .utils import SliceRangeSeqT, SliceRangeT, sjoin_, snormalize, slen, _sdirect, _isNegative
+from .utils import SliceRangeSeqT, SliceRangeT, sAny2Type, sjoin_, snormalize, slen, slice2range, sdirect, _sdirect, _isNegative, _getStepForComputation
+from .cache import LRUCache
 
 
-__all__ = ("SDiffAutomata", "sdiff", "sdiffSelectPred_", "sdiffSelect_", "ssub2_", "ssub", "sunion_", "sgap", "sdist")
+__all__ = ("SDiffAutomata", "sdiff", "sdiffSelectPred_", "sdiffSelect_", "ssub2_", "ssub", "sunion_", "sgap", "sdist", "enableMemoization", "disableMemoization", "getMemoization", "sjoin_overlaps_", "sdelta_", "sdelta", "DELTA_ADDED", "DELTA_REMOVED", "DELTA_UNCHANGED", "sintersect", "sintersects", "ssubStrided_", "scoverage", "scovered_")
 
 # pylint: disable=too-few-public-methods
 class SDiffAutomata:
@@ -31,16 +36,26 @@ class SDiffAutomata:
 		self.state = self.__class__.State.notEntered
 
 	def process(self, p: int, isExit: bool) -> None:
-		if self.state & self.__class__.State.entered:
-			if isExit:
-				self.state |= self.__class__.State.exited
-			else:
-				raise ValueError((p, isExit, self.state))
-		else:
-			if not isExit:
-				self.state |= self.__class__.State.entered
-			else:
-				raise ValueError((p, isExit, self.state))
+		newState = _TRANSITIONS[self.state * 2 + isExit]
+		if newState < 0:
+			raise ValueError((p, isExit, self.state))
+		self.state = self.__class__.State(newState)
+
+
+# The hot paths use plain ints instead of `SDiffAutomata.State`: a state of a range takes 2 bits (the same values as the flags), the states of all the ranges are packed into a single int code, `IntFlag`s are only created for the results.
+_STATE_BITS = 2
+_STATE_MASK = (1 << _STATE_BITS) - 1
+_NE = int(SDiffAutomata.State.notEntered)
+_EN = int(SDiffAutomata.State.entered)
+_EE = int(SDiffAutomata.State.entered | SDiffAutomata.State.exited)
+
+# indexed by `state * 2 + isExit`, -1 means an invalid transition
+_TRANSITIONS = (
+	_EN, -1,  # notEntered
+	-1, _EE,  # entered
+	-1, -1,  # exited without entering, unreachable
+	-1, _EE,  # entered | exited
+)
 
 
 sdiffBackDirRemap = {
@@ -53,91 +68,140 @@ sdiffBackDirRemap = {
 IntersectionStateT = typing.Tuple[SDiffAutomata.State, SDiffAutomata.State]
 
 
-class DiffFSMPoint:
-	__slots__ = ("pos", "rangeId", "isEnd")
-	def __init__(self, pos, rangeId, isEnd):
-		self.pos = pos
-		self.rangeId = rangeId
-		self.isEnd = isEnd
-
-	@property
-	def tuple(self):
-		return tuple(getattr(self, k) for k in self.__class__.__slots__)
+def _packedCodeToKey(code: int, count: int = 2) -> IntersectionStateT:
+	return tuple(SDiffAutomata.State((code >> (i * _STATE_BITS)) & _STATE_MASK) for i in range(count))
 
-	def __repr__(self):
-		return self.__class__.__name__ + repr(self.tuple)
 
-	def __eq__(self, another):
-		return self.tuple == another.tuple
+def _computeRemapTable(negMask: int, count: int = 2) -> typing.Tuple[int, ...]:
+	res = []
+	for code in range(1 << (_STATE_BITS * count)):
+		for i in range(count):
+			if negMask & (1 << i):
+				shift = i * _STATE_BITS
+				comp = (code >> shift) & _STATE_MASK
+				remapped = int(sdiffBackDirRemap.get(comp, comp))
+				code = (code & ~(_STATE_MASK << shift)) | (remapped << shift)
+		res.append(code)
+	return tuple(res)
 
-	def __hash__(self):
-		return hash(self.tuple)
 
-	def __gt__(self, another):
-		return self.pos > another.pos
+_CODE_TO_KEY = tuple(_packedCodeToKey(code) for code in range(1 << (_STATE_BITS * 2)))
+_REMAP_TABLES = tuple(_computeRemapTable(negMask) for negMask in range(1 << 2))
 
 
-def _computeEndpointRepresentation(rngs: SliceRangeSeqT):
+def _computeEndpointRepresentation(rngs: SliceRangeSeqT) -> typing.List[typing.Tuple[int, int, bool]]:
 	points = []
 	for i, el in enumerate(rngs):
-		points.extend((
-			DiffFSMPoint(el.start, i, False),
-			DiffFSMPoint(el.stop, i, True),
-		))
-	points.sort()
+		points.append((el.start, i, False))
+		points.append((el.stop, i, True))
+	points.sort(key=_getPos)
 	return points
 
 
-def _endpointsToMatrix(rs, points):
+def _getPos(pt: typing.Tuple[int, int, bool]) -> int:
+	return pt[0]
+
+
+def _endpointsToMatrix(rs, points) -> typing.Dict[int, typing.List[int]]:
+	"""Runs the automata of all the ranges over the endpoints. Returns a dict from packed state codes to the [start, stop] of the areas."""
 	matrix = {}
 
-	az = [SDiffAutomata() for i in range(len(rs))]
+	code = 0
+	transitions = _TRANSITIONS
 
-	state = tuple(a.state for a in az)
+	for pos, rangeId, isEnd in points:
+		if code not in matrix:
+			matrix[code] = [None, None]
+		matrix[code][1] = pos
 
-	for pt in points:
-		if state not in matrix:
-			matrix[state] = [None, None]
-		matrix[state][1] = pt.pos
-		az[pt.rangeId].process(pt.pos, pt.isEnd)
-		state = tuple(a.state for a in az)
-		if state not in matrix:
-			matrix[state] = [None, None]
-		matrix[state][0] = pt.pos
+		shift = rangeId * _STATE_BITS
+		newState = transitions[((code >> shift) & _STATE_MASK) * 2 + isEnd]
+		if newState < 0:
+			raise ValueError((pos, isEnd, SDiffAutomata.State((code >> shift) & _STATE_MASK)))
+		code = (code & ~(_STATE_MASK << shift)) | (newState << shift)
+
+		if code not in matrix:
+			matrix[code] = [None, None]
+		matrix[code][0] = pos
 
 	#print("matrix", matrix)
-	del matrix[(SDiffAutomata.State.notEntered, SDiffAutomata.State.notEntered)]
-	del matrix[(SDiffAutomata.State.entered | SDiffAutomata.State.exited, SDiffAutomata.State.entered | SDiffAutomata.State.exited)]
+	allExited = 0
+	for i in range(len(rs)):
+		allExited |= _EE << (i * _STATE_BITS)
+	del matrix[0]
+	del matrix[allExited]
 	return matrix
 
 
-def getDirectorRangeIndex(s0: SDiffAutomata.State, s1: SDiffAutomata.State) -> int:
-	if (s1 & SDiffAutomata.State.entered and not s1 & SDiffAutomata.State.exited) and not (s0 & SDiffAutomata.State.entered and not s0 & SDiffAutomata.State.exited):
-		return 1
-	return 0
-
-
-def _postProcessMatrix(rs, matrix):
-	newMatrix = type(matrix)()
+def _postProcessMatrix(rs, matrix: typing.Dict[int, typing.List[int]]) -> typing.Dict[IntersectionStateT, SliceRangeT]:
+	newMatrix = {}
 
 	shouldRemapComp = _isNegative(rs)
+	remapTable = _REMAP_TABLES[shouldRemapComp[0] | (shouldRemapComp[1] << 1)]
 
-	for k in matrix:
-		el = matrix[k]
-		if el[0] == el[1]:
+	for code, el in matrix.items():
+		start, stop = el
+		if start == stop:
 			continue
 
-		directorIdx = getDirectorRangeIndex(*k)
+		directorIdx = 1 if ((code >> _STATE_BITS) & _STATE_MASK) == _EN and (code & _STATE_MASK) != _EN else 0
 		dR = rs[directorIdx]
 		if shouldRemapComp[directorIdx]:
-			el = (el[1] - 1, el[0] - 1)
-		
-		k = tuple((sdiffBackDirRemap[comp] if shouldRemapComp[i] else comp) for i, comp in enumerate(k))
+			start, stop = stop - 1, start - 1
 
-		newMatrix[k] = dR.__class__(el[0], el[1], dR.step)
+		newMatrix[_CODE_TO_KEY[remapTable[code]]] = dR.__class__(start, stop, dR.step)
 	return newMatrix
 
 
+_memo = None
+_missing = object()
+
+
+def enableMemoization(maxSize: int = 1024) -> LRUCache:
+	"""Enables memoization of `sdiff`, `sgap`, `sdist` and `ssub2_` in a bounded LRU cache keyed by the types and `(start, stop, step)` of the operands. Returns the cache, use it to get the statistics or to clear it."""
+	global _memo
+	_memo = LRUCache(maxSize)
+	return _memo
+
+
+def disableMemoization() -> None:
+	global _memo
+	_memo = None
+
+
+def getMemoization() -> typing.Optional[LRUCache]:
+	return _memo
+
+
+def _identity(v: typing.Any) -> typing.Any:
+	return v
+
+
+def _memoizable(freeze: typing.Callable = _identity, thaw: typing.Callable = _identity) -> typing.Callable:
+	"""`freeze` converts a result into an immutable form stored in the cache, `thaw` converts the stored form into a result returned to the caller."""
+
+	def decorator(f: typing.Callable) -> typing.Callable:
+		name = f.__name__
+
+		@wraps(f)
+		def f1(*args):
+			memo = _memo
+			if memo is None:
+				return f(*args)
+
+			key = (name,) + tuple((a.__class__, a.start, a.stop, a.step) for a in args)
+			res = memo.get(key, _missing)
+			if res is _missing:
+				res = freeze(f(*args))
+				memo[key] = res
+			return thaw(res)
+
+		return f1
+
+	return decorator
+
+
+@_memoizable(thaw=dict)
 def sdiff(s0: SliceRangeT, s1: SliceRangeT) -> typing.Dict[IntersectionStateT, SliceRangeT]:
 	"""Computes a difference of 2 slices/ranges. More than 2 is not yet implemented, though planned."""
 	# pylint: disable=too-many-locals
@@ -165,6 +229,7 @@ def sdiffSelect_(s1: SliceRangeT, s2: SliceRangeT, keys: list, neg: bool = False
 			yield res[k]
 
 
+@_memoizable(freeze=tuple, thaw=iter)
 def ssub2_(s1: SliceRangeT, s2: SliceRangeT) -> SliceRangeSeqT:
 	"""Subtracts 2 ranges"""
 	S = SDiffAutomata.State
@@ -193,6 +258,7 @@ def sunion_(s1: SliceRangeT, s2: SliceRangeT) -> SliceRangeSeqT:
 	return sjoin_(sorted(sdiffSelectPred_(s1, s2, pred), key=lambda e: snormalize(e).start))
 
 
+@_memoizable()
 def sgap(s1: SliceRangeT, s2: SliceRangeT) -> typing.Optional[SliceRangeT]:
 	"""Returns a gap between 2 ranges"""
 	S = SDiffAutomata.State
@@ -207,6 +273,7 @@ def sgap(s1: SliceRangeT, s2: SliceRangeT) -> typing.Optional[SliceRangeT]:
 		return None
 
 
+@_memoizable()
 def sdist(s1: SliceRangeT, s2: SliceRangeT) -> int:
 	"""Returns length of a gap between 2 ranges"""
 	gap = sgap(s1, s2)
@@ -214,3 +281,255 @@ def sdist(s1: SliceRangeT, s2: SliceRangeT) -> int:
 		return slen(gap)
 	else:
 		return 0
+
+
+def _apPositive(s: SliceRangeT) -> range:
+	"""Returns the points of the range/slice as a positive-directed range, exactly, whatever the step is."""
+	r = slice2range(s)
+	if r.step < 0:
+		return r[::-1]
+	return r
+
+
+def _modInverse(a: int, m: int) -> int:
+	"""Inverse of `a` modulo `m` (`a` and `m` must be coprime) by the extended Euclidean algorithm."""
+	x, prevX = 0, 1
+	r, prevR = m, a % m
+	while r:
+		q = prevR // r
+		prevR, r = r, prevR - q * r
+		prevX, x = x, prevX - q * x
+	return prevX % m
+
+
+def _apIntersection(a: range, b: range) -> typing.Optional[range]:
+	"""Intersects 2 positive-directed arithmetic progressions by solving the system of congruences `x = a.start (mod a.step)`, `x = b.start (mod b.step)` (the Chinese remainder theorem). The result has the step `lcm(a.step, b.step)`."""
+	if not a or not b:
+		return None
+
+	p, q = a.step, b.step
+	g = gcd(p, q)
+	d = b.start - a.start
+	if d % g:
+		return None
+
+	qg = q // g
+	x0 = a.start + p * ((d // g) * _modInverse(p // g, qg) % qg)
+	l = p // g * q
+	lo = max(a.start, b.start)
+	last = min(a[-1], b[-1])
+	first = lo + (x0 - lo) % l
+	if first > last:
+		return None
+	return range(first, last + 1, l)
+
+
+def sintersect(s1: SliceRangeT, s2: SliceRangeT) -> typing.Optional[SliceRangeT]:
+	"""Returns the exact intersection of the sets of points of 2 ranges/slices of any steps, or `None` if it is empty. Unlike `sdiff`, strides are taken into account. The result has the type and the direction of `s1`. O(log(step)), the length of the ranges doesn't matter."""
+	res = _apIntersection(_apPositive(s1), _apPositive(s2))
+	if res is None:
+		return None
+	if s1.stop < s1.start:
+		res = res[::-1]
+	return sAny2Type(res, s1.__class__)
+
+
+def sintersects(s1: SliceRangeT, s2: SliceRangeT) -> bool:
+	"""Checks if 2 ranges/slices of any steps have common points. O(log(step))."""
+	return _apIntersection(_apPositive(s1), _apPositive(s2)) is not None
+
+
+def ssubStrided_(s1: SliceRangeT, s2: SliceRangeT) -> SliceRangeSeqT:
+	"""Subtracts the points of `s2` from the ones of `s1`, taking strides into account. Within the span of the intersection every `k`-th point of `s1` is removed (`k = lcm(steps) / step of s1`), so the rest is returned as the `k - 1` residue classes, each one is a range with the step of the intersection, plus the parts of `s1` before and after the span. The pieces don't overlap, but they interleave, they are not sorted. They have the type and the direction of `s1`. O(k), the length of the ranges doesn't matter."""
+	a = _apPositive(s1)
+	common = _apIntersection(a, _apPositive(s2))
+	if common is None:
+		if a:
+			yield s1
+		return
+
+	p = a.step
+	i0 = (common[0] - a.start) // p
+	i1 = (common[-1] - a.start) // p
+	k = common.step // p
+	pieces = [a[:i0]]
+	pieces.extend(a[i0 + c:i1:k] for c in range(1, k))
+	pieces.append(a[i1 + 1:])
+
+	isNeg = s1.stop < s1.start
+	if isNeg:
+		pieces.reverse()
+
+	tp = s1.__class__
+	for piece in pieces:
+		if piece:
+			if isNeg:
+				piece = piece[::-1]
+			yield sAny2Type(piece, tp)
+
+
+def _enumerateNormalized(rngs: SliceRangeSeqT, side: int) -> typing.Iterator[typing.Tuple[int, int, int, int, SliceRangeT]]:
+	for i, r in enumerate(rngs):
+		n = slice2range(snormalize(r))
+		yield n.start, side, i, n.stop, r
+
+
+def sjoin_overlaps_(a: SliceRangeSeqT, b: SliceRangeSeqT, tolerance: int = 0, sameDirection: bool = False) -> typing.Iterator[typing.Tuple[int, int, typing.Optional[SliceRangeT]]]:
+	"""Finds all the overlapping pairs of ranges from 2 streams, each sorted by the start of the normalized range. Yields `(i, j, intersection)` where `i` and `j` are the indexes of the ranges in `a` and `b`. The intersection has the type and the direction of `a[i]`. With `tolerance` the pairs separated by a gap shorter than it are also yielded, the intersection is `None` for them. With `sameDirection` the pairs of ranges of opposite directions are skipped. Works in a single merge pass, keeping only the ranges which can still overlap the upcoming ones: the active ranges of both streams are kept in min-heaps by their ends and the ended ones are popped on every step, so the memory is bounded by the count of the ranges overlapping a point even if one of the streams is sparse."""
+	active = ([], [])
+	for lo, side, idx, hi, r in heapq.merge(_enumerateNormalized(a, 0), _enumerateNormalized(b, 1)):
+		for h in active:
+			while h and h[0][0] + tolerance <= lo:
+				heapq.heappop(h)
+		other = active[1 - side]
+		isNeg = r.stop < r.start
+		for oHi, oIdx, oR in other:
+			if sameDirection and (oR.stop < oR.start) != isNeg:
+				continue
+
+			if side:
+				i, j, ra = oIdx, idx, oR
+			else:
+				i, j, ra = idx, oIdx, r
+
+			iHi = min(hi, oHi)
+			if lo < iHi:
+				intersection = sdirect(ra, ra.__class__(lo, iHi, abs(_getStepForComputation(ra))))
+			else:
+				intersection = None
+			yield i, j, intersection
+		heapq.heappush(active[side], (hi, idx, r))
+
+
+_S = SDiffAutomata.State
+DELTA_REMOVED = (_S.entered, _S.notEntered)
+DELTA_ADDED = (_S.notEntered, _S.entered)
+DELTA_UNCHANGED = (_S.entered, _S.entered)
+
+
+def _iterNormalizedBounds(rngs: SliceRangeSeqT) -> typing.Iterator[typing.Tuple[int, int, SliceRangeT]]:
+	for r in rngs:
+		if not slice2range(r):
+			continue
+		n = snormalize(r)
+		yield n.start, n.stop, n
+
+
+def _sdeltaSegments(old: SliceRangeSeqT, new: SliceRangeSeqT) -> typing.Iterator[typing.Tuple[IntersectionStateT, int, int, SliceRangeT]]:
+	oi = _iterNormalizedBounds(old)
+	ni = _iterNormalizedBounds(new)
+	o = next(oi, None)
+	n = next(ni, None)
+	while o is not None or n is not None:
+		if n is None or (o is not None and o[1] <= n[0]):
+			yield (DELTA_REMOVED, *o)
+			o = next(oi, None)
+		elif o is None or n[1] <= o[0]:
+			yield (DELTA_ADDED, *n)
+			n = next(ni, None)
+		elif o[0] != n[0]:
+			if o[0] < n[0]:
+				yield DELTA_REMOVED, o[0], n[0], o[2]
+				o = (n[0], o[1], o[2])
+			else:
+				yield DELTA_ADDED, n[0], o[0], n[2]
+				n = (o[0], n[1], n[2])
+		else:
+			hi = min(o[1], n[1])
+			yield DELTA_UNCHANGED, o[0], hi, n[2]
+			o = (hi, o[1], o[2]) if hi < o[1] else next(oi, None)
+			n = (hi, n[1], n[2]) if hi < n[1] else next(ni, None)
+
+
+def sdelta_(old: SliceRangeSeqT, new: SliceRangeSeqT) -> typing.Iterator[typing.Tuple[IntersectionStateT, SliceRangeT]]:
+	"""Computes the changes between 2 snapshots of a set of ranges. Both sequences must be sorted by the start of the normalized ranges and their ranges must not overlap each other. Yields `(key, segment)` in the order of positions, where `key` is in the terms of `sdiff` with the state relative to `old` first and the one relative to `new` second: `DELTA_REMOVED`, `DELTA_ADDED` or `DELTA_UNCHANGED`. The segments are positive-directed, the adjacent segments with the same key are merged. Works in a single merge pass."""
+	pending = None
+	for key, lo, hi, proto in _sdeltaSegments(old, new):
+		if pending is not None:
+			if pending[0] is key and pending[2] == lo:
+				pending[2] = hi
+				continue
+			yield pending[0], pending[3].__class__(pending[1], pending[2], pending[3].step)
+		pending = [key, lo, hi, proto]
+
+	if pending is not None:
+		yield pending[0], pending[3].__class__(pending[1], pending[2], pending[3].step)
+
+
+def sdelta(old: SliceRangeSeqT, new: SliceRangeSeqT) -> typing.Tuple[SliceRangeSeqT, SliceRangeSeqT, SliceRangeSeqT]:
+	"""Returns `(added, removed, unchanged)` tuples of segments computed by `sdelta_`."""
+	res = {DELTA_ADDED: [], DELTA_REMOVED: [], DELTA_UNCHANGED: []}
+	for key, segment in sdelta_(old, new):
+		res[key].append(segment)
+	return tuple(res[DELTA_ADDED]), tuple(res[DELTA_REMOVED]), tuple(res[DELTA_UNCHANGED])
+
+
+def _scoverageArray(rows: typing.Any) -> typing.Tuple[typing.Any, typing.Any]:
+	import numpy as np
+
+	starts = np.asarray(rows[:, 0], dtype=np.int64)
+	stops = np.asarray(rows[:, 1], dtype=np.int64)
+	if rows.shape[1] > 2:
+		steps = np.asarray(rows[:, 2], dtype=np.int64)
+	else:
+		steps = np.where(stops < starts, -1, 1)
+	counts = (stops - starts + steps - np.sign(steps)) // steps
+	nonEmpty = counts > 0
+	starts = starts[nonEmpty]
+	lasts = starts + (counts[nonEmpty] - 1) * steps[nonEmpty]
+	lo = np.minimum(starts, lasts)
+	hi = np.maximum(starts, lasts) + 1
+
+	pos = np.concatenate((lo, hi))
+	deltas = np.concatenate((np.ones(len(lo), dtype=np.int64), np.full(len(hi), -1, dtype=np.int64)))
+	order = np.argsort(pos, kind="stable")
+	pos = pos[order]
+	depths = np.cumsum(deltas[order])
+	if not len(pos):
+		return pos, depths
+
+	last = np.append(np.flatnonzero(np.diff(pos)), len(pos) - 1)
+	return pos[last], depths[last][:-1]
+
+
+def scoverage(ranges: typing.Any) -> typing.Tuple[typing.Sequence[int], typing.Sequence[int]]:
+	"""Computes how many ranges cover each point. Returns `(breakpoints, depths)`: `depths[i]` is the depth within `[breakpoints[i], breakpoints[i + 1])`, the gaps of zero depth between the ranges are included. The ranges are treated as contiguous, like in `sdiff`: a strided range covers everything from its first point to its last one. A single sort and a cumulative sum over the +1/-1 events of the endpoints. For a 2D array of `(start, stop[, step])` rows, such as a NumPy one (the step of 2-column rows is -1 if `stop < start`, 1 otherwise), the computation is vectorized and arrays are returned, `numpy.column_stack((breakpoints[:-1], breakpoints[1:]))` can be used as an index for `RangesTree.build`."""
+	if getattr(ranges, "ndim", None) == 2:
+		return _scoverageArray(ranges)
+
+	events = []
+	for r in ranges:
+		a = _apPositive(r)
+		if a:
+			events.append((a[0], 1))
+			events.append((a[-1] + 1, -1))
+	events.sort(key=_getPos)
+
+	breakpoints = []
+	depths = []
+	depth = 0
+	for pos, group in groupby(events, key=_getPos):
+		for _, d in group:
+			depth += d
+		breakpoints.append(pos)
+		depths.append(depth)
+
+	if depths:
+		depths.pop()
+	return tuple(breakpoints), tuple(depths)
+
+
+def scovered_(ranges: typing.Any, minDepth: int = 1) -> SliceRangeSeqT:
+	"""Yields the positive-directed ranges covered by at least `minDepth` of `ranges`, the adjacent ones merged. Accepts everything `scoverage` accepts."""
+	breakpoints, depths = scoverage(ranges)
+	start = None
+	for i, d in enumerate(depths):
+		if d >= minDepth:
+			if start is None:
+				start = breakpoints[i]
+		elif start is not None:
+			yield range(int(start), int(breakpoints[i]))
+			start = None
+
+	if start is not None:
+		yield range(int(start), int(breakpoints[len(depths)]))
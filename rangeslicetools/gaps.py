@@ -0,0 +1,329 @@
+import typing
+import random
+
+from .interop import asRangeColumns
+from .utils import SliceRangeT, SliceRangeSeqT, slice2range, snormalize
+
+__all__ = ("GapIndex",)
+
+
+class _GapNode:
+	"""A node of a treap of disjoint allocated extents keyed by their starts. Each node is augmented with the bounds of its subtree and the max gap between the extents within it."""
+
+	__slots__ = ("start", "stop", "priority", "left", "right", "minStart", "maxStop", "maxGap")
+
+	def __init__(self, start: int, stop: int, priority: float) -> None:
+		self.start = start
+		self.stop = stop
+		self.priority = priority
+		self.left = None
+		self.right = None
+		self.update()
+
+	def update(self) -> None:
+		left = self.left
+		right = self.right
+		maxGap = 0
+		if left is not None:
+			self.minStart = left.minStart
+			maxGap = max(left.maxGap, self.start - left.maxStop)
+		else:
+			self.minStart = self.start
+
+		if right is not None:
+			self.maxStop = right.maxStop
+			maxGap = max(maxGap, right.maxGap, right.minStart - self.stop)
+		else:
+			self.maxStop = self.stop
+
+		self.maxGap = maxGap
+
+
+def _split(node: typing.Optional[_GapNode], key: int) -> typing.Tuple[typing.Optional[_GapNode], typing.Optional[_GapNode]]:
+	"""Splits into the nodes with `start < key` and the rest."""
+	if node is None:
+		return None, None
+	if node.start < key:
+		l, r = _split(node.right, key)
+		node.right = l
+		node.update()
+		return node, r
+	l, r = _split(node.left, key)
+	node.left = r
+	node.update()
+	return l, node
+
+
+def _merge(a: typing.Optional[_GapNode], b: typing.Optional[_GapNode]) -> typing.Optional[_GapNode]:
+	"""Merges 2 treaps, all the keys of `a` must be less than the keys of `b`."""
+	if a is None:
+		return b
+	if b is None:
+		return a
+	if a.priority > b.priority:
+		a.right = _merge(a.right, b)
+		a.update()
+		return a
+	b.left = _merge(a, b.left)
+	b.update()
+	return b
+
+
+def _fitFrom(node: typing.Optional[_GapNode], length: int, pos: typing.Union[int, float]) -> typing.Optional[int]:
+	"""Returns the start of the first internal gap of the subtree, having at least `length` free points not before `pos`."""
+	if node is None or node.maxGap < length or node.maxStop <= pos:
+		return None
+
+	left = node.left
+	right = node.right
+
+	if left is not None:
+		res = _fitFrom(left, length, pos)
+		if res is not None:
+			return res
+
+		gs = max(left.maxStop, pos)
+		if node.start - gs >= length:
+			return gs
+
+	if right is not None:
+		gs = max(node.stop, pos)
+		if right.minStart - gs >= length:
+			return gs
+
+		return _fitFrom(right, length, pos)
+
+	return None
+
+
+class _GapSizeNode:
+	"""A node of a treap of the free gaps keyed by `(length, start)`."""
+
+	__slots__ = ("key", "priority", "left", "right")
+
+	def __init__(self, key: typing.Tuple[int, int], priority: float) -> None:
+		self.key = key
+		self.priority = priority
+		self.left = None
+		self.right = None
+
+
+def _splitSizes(node: typing.Optional[_GapSizeNode], key: typing.Tuple[int, int]) -> typing.Tuple[typing.Optional[_GapSizeNode], typing.Optional[_GapSizeNode]]:
+	"""Splits into the nodes with keys less than `key` and the rest."""
+	if node is None:
+		return None, None
+	if node.key < key:
+		l, r = _splitSizes(node.right, key)
+		node.right = l
+		return node, r
+	l, r = _splitSizes(node.left, key)
+	node.left = r
+	return l, node
+
+
+def _mergeSizes(a: typing.Optional[_GapSizeNode], b: typing.Optional[_GapSizeNode]) -> typing.Optional[_GapSizeNode]:
+	"""Merges 2 treaps, all the keys of `a` must be less than the keys of `b`."""
+	if a is None:
+		return b
+	if b is None:
+		return a
+	if a.priority > b.priority:
+		a.right = _mergeSizes(a.right, b)
+		return a
+	b.left = _mergeSizes(a, b.left)
+	return b
+
+
+def _iterNodes(node: typing.Optional[_GapNode]) -> typing.Iterator[_GapNode]:
+	stack = []
+	while stack or node is not None:
+		if node is not None:
+			stack.append(node)
+			node = node.left
+		else:
+			node = stack.pop()
+			yield node
+			node = node.right
+
+
+class GapIndex:
+	"""Keeps a set of disjoint allocated extents within an `arena` and finds free gaps in it. The extents are stored in a treap augmented with the max gap in each subtree, so first-fit and next-fit queries take O(log n) expected time. The free gaps (including the ones at the edges of the arena) are also kept in a second treap ordered by `(length, start)`, so best-fit is a lower-bound search, O(log n) expected too. `allocate` and `free` update both treaps in O(log n) expected time. Works with positive-directed ranges, others are normalized."""
+
+	__slots__ = ("arena", "cursor", "_root", "_sizes", "_rnd")
+
+	def __init__(self, arena: SliceRangeT, allocated: SliceRangeSeqT = (), seed: typing.Any = None) -> None:
+		self.arena = slice2range(snormalize(arena))
+		self.cursor = self.arena.start
+		self._root = None
+		self._sizes = None
+		self._rnd = random.Random(seed)
+		self._addGap(self.arena.start, self.arena.stop)
+		columns = asRangeColumns(allocated)
+		if columns is not None:
+			allocated = columns
+		for el in allocated:
+			self.reserve(el)
+
+	def __iter__(self) -> typing.Iterator[range]:
+		"""Iterates the allocated extents in order."""
+		for n in _iterNodes(self._root):
+			yield range(n.start, n.stop)
+
+	def gaps(self) -> typing.Iterator[range]:
+		"""Iterates the free gaps in order."""
+		prev = self.arena.start
+		for n in _iterNodes(self._root):
+			if n.start > prev:
+				yield range(prev, n.start)
+			prev = n.stop
+		if self.arena.stop > prev:
+			yield range(prev, self.arena.stop)
+
+	def _findFloor(self, pos: int) -> typing.Optional[_GapNode]:
+		"""Returns the extent with the greatest start not exceeding `pos`."""
+		node = self._root
+		res = None
+		while node is not None:
+			if node.start <= pos:
+				res = node
+				node = node.right
+			else:
+				node = node.left
+		return res
+
+	def _findCeiling(self, pos: int) -> typing.Optional[_GapNode]:
+		"""Returns the extent with the least start not less than `pos`."""
+		node = self._root
+		res = None
+		while node is not None:
+			if node.start >= pos:
+				res = node
+				node = node.left
+			else:
+				node = node.right
+		return res
+
+	def _addGap(self, start: int, stop: int) -> None:
+		if start < stop:
+			key = (stop - start, start)
+			l, r = _splitSizes(self._sizes, key)
+			self._sizes = _mergeSizes(_mergeSizes(l, _GapSizeNode(key, self._rnd.random())), r)
+
+	def _discardGap(self, start: int, stop: int) -> None:
+		if start < stop:
+			key = (stop - start, start)
+			l, r = _splitSizes(self._sizes, key)
+			_, r = _splitSizes(r, (key[0], start + 1))
+			self._sizes = _mergeSizes(l, r)
+
+	def _gapBounds(self, start: int, stop: int) -> typing.Tuple[int, int]:
+		"""Returns the end of the extent before `start` and the start of the extent after `stop` (or the bounds of the arena)."""
+		prev = self._findFloor(start - 1)
+		nxt = self._findCeiling(stop)
+		return (prev.stop if prev is not None else self.arena.start), (nxt.start if nxt is not None else self.arena.stop)
+
+	def _insert(self, start: int, stop: int) -> None:
+		gs, ge = self._gapBounds(start, stop)
+		self._discardGap(gs, ge)
+		self._addGap(gs, start)
+		self._addGap(stop, ge)
+
+		l, r = _split(self._root, start)
+		self._root = _merge(_merge(l, _GapNode(start, stop, self._rnd.random())), r)
+
+	def _remove(self, start: int) -> None:
+		l, r = _split(self._root, start)
+		node, r = _split(r, start + 1)
+		self._root = _merge(l, r)
+
+		gs, ge = self._gapBounds(start, node.stop)
+		self._discardGap(gs, start)
+		self._discardGap(node.stop, ge)
+		self._addGap(gs, ge)
+
+	def reserve(self, rng: SliceRangeT) -> range:
+		"""Marks `rng` as allocated. It must be free and within the arena."""
+		rng = slice2range(snormalize(rng))
+		if rng.start < self.arena.start or rng.stop > self.arena.stop:
+			raise ValueError(repr(rng) + " is out of the arena " + repr(self.arena))
+
+		floor = self._findFloor(rng.start)
+		ceiling = self._findCeiling(rng.start)
+		if (floor is not None and floor.stop > rng.start) or (ceiling is not None and ceiling.start < rng.stop):
+			raise ValueError(repr(rng) + " overlaps an allocated extent")
+
+		self._insert(rng.start, rng.stop)
+		return rng
+
+	def _fit(self, length: int, pos: typing.Union[int, float]) -> typing.Optional[int]:
+		arena = self.arena
+		root = self._root
+		gs = max(arena.start, pos)
+		if root is None:
+			if arena.stop - gs >= length:
+				return gs
+			return None
+
+		if root.minStart - gs >= length:
+			return gs
+
+		res = _fitFrom(root, length, pos)
+		if res is not None:
+			return res
+
+		gs = max(root.maxStop, pos)
+		if arena.stop - gs >= length:
+			return gs
+		return None
+
+	def first_fit(self, length: int) -> typing.Optional[range]:
+		"""Returns the first free gap of at least `length` points, truncated to `length`."""
+		gs = self._fit(length, self.arena.start)
+		if gs is None:
+			return None
+		return range(gs, gs + length)
+
+	def next_fit(self, length: int) -> typing.Optional[range]:
+		"""Like `first_fit`, but starts searching from `cursor` (the end of the previous allocation), wrapping around the arena."""
+		gs = self._fit(length, self.cursor)
+		if gs is None:
+			gs = self._fit(length, self.arena.start)
+			if gs is None:
+				return None
+		return range(gs, gs + length)
+
+	def best_fit(self, length: int) -> typing.Optional[range]:
+		"""Returns the smallest free gap of at least `length` points, truncated to `length`. Of the equal ones the first is chosen."""
+		node = self._sizes
+		best = None
+		while node is not None:
+			if node.key[0] >= length:
+				best = node.key
+				node = node.left
+			else:
+				node = node.right
+		if best is None:
+			return None
+		return range(best[1], best[1] + length)
+
+	def allocate(self, length: int, strategy: str = "first") -> typing.Optional[range]:
+		"""Finds a free gap of `length` points using the `strategy` (`first`, `best` or `next`) and marks it as allocated. Returns `None` if there is no such gap."""
+		res = getattr(self, strategy + "_fit")(length)
+		if res is not None:
+			self._insert(res.start, res.stop)
+			self.cursor = res.stop
+		return res
+
+	def free(self, rng: SliceRangeT) -> None:
+		"""Marks `rng` as free. It must be within a single allocated extent, the remainders of the extent stay allocated."""
+		rng = slice2range(snormalize(rng))
+		ext = self._findFloor(rng.start)
+		if ext is None or ext.stop < rng.stop:
+			raise ValueError(repr(rng) + " is not within an allocated extent")
+
+		start, stop = ext.start, ext.stop
+		self._remove(start)
+		if start < rng.start:
+			self._insert(start, rng.start)
+		if rng.stop < stop:
+			self._insert(rng.stop, stop)
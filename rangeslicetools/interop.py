@@ -0,0 +1,141 @@
+"""Converters between the sequences of ranges and the columnar containers of pandas and Arrow. The libraries are imported lazily, install the `pandas` and `arrow` extras to use them."""
+
+import typing
+from collections.abc import Sequence
+
+from .utils import SliceRangeSeqT, SliceRangeT, SliceRangeTypeT, _getStepForComputation, _mk, slice2range
+
+__all__ = ("RangeColumns", "asRangeColumns", "fromIntervalIndex", "toIntervalIndex", "fromArrow", "fromArrowColumns", "toArrow")
+
+
+class RangeColumns(Sequence):
+	"""Presents columns of starts, stops and optionally steps (NumPy arrays or anything indexable) as a sequence of ranges, creating them on access. The columns are not copied, slicing slices the columns. Without the steps column the step of a row is -1 if `stop < start`, 1 otherwise."""
+
+	__slots__ = ("starts", "stops", "steps", "tp")
+
+	def __init__(self, starts: typing.Any, stops: typing.Any, steps: typing.Any = None, tp: SliceRangeTypeT = range) -> None:
+		if len(starts) != len(stops) or (steps is not None and len(steps) != len(starts)):
+			raise ValueError("The columns must be of the same length")
+		self.starts = starts
+		self.stops = stops
+		self.steps = steps
+		self.tp = tp
+
+	def __len__(self) -> int:
+		return len(self.starts)
+
+	def __getitem__(self, i: typing.Union[int, slice]) -> typing.Union[SliceRangeT, "RangeColumns"]:
+		if isinstance(i, slice):
+			return self.__class__(self.starts[i], self.stops[i], self.steps[i] if self.steps is not None else None, self.tp)
+		start, stop = int(self.starts[i]), int(self.stops[i])
+		if self.steps is None:
+			if stop < start:
+				return _mk(self.tp, start, stop, -1)
+			return _mk(self.tp, start, stop)
+		return _mk(self.tp, start, stop, int(self.steps[i]))
+
+	def bounds(self) -> typing.Tuple[typing.Any, typing.Any]:
+		"""Returns the columns of the normalized (positive-directed) starts and stops. They are the original columns if all the ranges are positive-directed, otherwise NumPy arrays."""
+		import numpy as np
+
+		starts = np.asarray(self.starts)
+		stops = np.asarray(self.stops)
+		isNeg = stops < starts
+		if not isNeg.any():
+			return self.starts, self.stops
+		return np.where(isNeg, stops + 1, starts), np.where(isNeg, starts + 1, stops)
+
+
+def _asBoundsColumns(ranges: SliceRangeSeqT) -> typing.Tuple[typing.Any, typing.Any]:
+	if isinstance(ranges, RangeColumns):
+		return ranges.bounds()
+
+	starts = []
+	stops = []
+	for r in ranges:
+		r = slice2range(r)
+		if r.step < 0:
+			r = r[::-1]
+		starts.append(r.start)
+		stops.append(r[-1] + 1 if r else r.start)
+	return starts, stops
+
+
+def fromIntervalIndex(intervals: typing.Any, tp: SliceRangeTypeT = range) -> RangeColumns:
+	"""Wraps a `pandas.IntervalIndex` (or an `IntervalArray`) of integers. The bounds are not copied if the intervals are closed on the left, otherwise they are shifted to make them half-open."""
+	left = intervals.left.to_numpy()
+	right = intervals.right.to_numpy()
+	if left.dtype.kind not in "iu" or right.dtype.kind not in "iu":
+		raise ValueError("Only integer intervals can be converted to ranges, got " + repr(left.dtype))
+
+	closed = intervals.closed
+	if closed not in ("left", "both"):
+		left = left + 1
+	if closed in ("right", "both"):
+		right = right + 1
+	return RangeColumns(left, right, tp=tp)
+
+
+def toIntervalIndex(ranges: SliceRangeSeqT, name: typing.Optional[str] = None) -> typing.Any:
+	"""Creates a `pandas.IntervalIndex` closed on the left from the ranges. The ranges are normalized, the steps are lost. The columns of `RangeColumns` of positive-directed ranges are used without conversion."""
+	import pandas as pd
+
+	starts, stops = _asBoundsColumns(ranges)
+	return pd.IntervalIndex.from_arrays(starts, stops, closed="left", name=name)
+
+
+def _arrowToNumpy(arr: typing.Any) -> typing.Any:
+	"""Views an Arrow array (or a chunked one) as a NumPy array. Zero-copy for a single chunk of integers without nulls."""
+	if hasattr(arr, "combine_chunks"):
+		arr = arr.chunk(0) if arr.num_chunks == 1 else arr.combine_chunks()
+	if arr.null_count:
+		raise ValueError("Null bounds cannot be converted to ranges")
+	return arr.to_numpy(zero_copy_only=False)
+
+
+def fromArrowColumns(starts: typing.Any, stops: typing.Any, steps: typing.Any = None, tp: SliceRangeTypeT = range) -> RangeColumns:
+	"""Wraps Arrow integer arrays (or chunked arrays) of starts, stops and optionally steps."""
+	return RangeColumns(_arrowToNumpy(starts), _arrowToNumpy(stops), _arrowToNumpy(steps) if steps is not None else None, tp)
+
+
+def fromArrow(obj: typing.Any, start: str = "start", stop: str = "stop", step: typing.Optional[str] = None, tp: SliceRangeTypeT = range) -> RangeColumns:
+	"""Wraps the `start`, `stop` and optionally `step` fields of an Arrow struct array (or a chunked one) or the columns of an Arrow table or record batch."""
+	names = (start, stop) if step is None else (start, stop, step)
+	if hasattr(obj, "column"):
+		columns = [obj.column(n) for n in names]
+	else:
+		if hasattr(obj, "combine_chunks"):
+			obj = obj.combine_chunks()
+		fields = obj.flatten()
+		columns = [fields[obj.type.get_field_index(n)] for n in names]
+	return fromArrowColumns(*columns, tp=tp)
+
+
+def toArrow(ranges: SliceRangeSeqT) -> typing.Any:
+	"""Creates an Arrow struct array of `start`, `stop` and `step` int64 fields. The columns of `RangeColumns` are used without conversion where possible."""
+	import pyarrow as pa
+
+	if isinstance(ranges, RangeColumns):
+		starts, stops, steps = ranges.starts, ranges.stops, ranges.steps
+		if steps is None:
+			import numpy as np
+
+			steps = np.where(np.asarray(stops) < np.asarray(starts), -1, 1)
+	else:
+		ranges = tuple(ranges)
+		starts = [r.start for r in ranges]
+		stops = [r.stop for r in ranges]
+		steps = [_getStepForComputation(r) for r in ranges]
+
+	return pa.StructArray.from_arrays([pa.array(c, pa.int64()) for c in (starts, stops, steps)], names=["start", "stop", "step"])
+
+
+def asRangeColumns(obj: typing.Any) -> typing.Optional[RangeColumns]:
+	"""Wraps a pandas `IntervalIndex` or an Arrow struct array, table or record batch into `RangeColumns`. Returns `None` for other objects. Detects them without importing the libraries."""
+	if isinstance(obj, RangeColumns):
+		return obj
+	if hasattr(obj, "closed") and hasattr(obj, "left") and hasattr(obj, "right"):
+		return fromIntervalIndex(obj)
+	if type(obj).__module__.split(".", 1)[0] == "pyarrow":
+		return fromArrow(obj)
+	return None
@@ -0,0 +1,70 @@
+import typing
+from bisect import bisect_right
+
+from .interop import asRangeColumns
+from .utils import SliceRangeListT, SliceRangeOptListT, SliceRangeT, isInstArg, sAny2Type, slice2range, _getStepForComputation, _integrator, _slen
+
+__all__ = ("OffsetIndex",)
+
+
+class OffsetIndex:
+	"""Translates logical offsets (counted from the beginning of a sequence of ranges, the same way as in `soffset_split_`) into physical positions. Prefix sums of lengths of the ranges are precomputed, so every lookup is a binary search. Negative-directed ranges are supported."""
+
+	__slots__ = ("ranges", "ends")
+
+	def __init__(self, ranges: SliceRangeOptListT) -> None:
+		if isinstance(ranges, isInstArg):
+			ranges = (ranges,)
+		else:
+			columns = asRangeColumns(ranges)
+			if columns is not None:
+				ranges = columns
+		self.ranges = tuple(ranges)
+		self.ends = tuple(_integrator(map(_slen, self.ranges)))
+
+	def __len__(self) -> int:
+		"""Total logical length."""
+		if self.ends:
+			return self.ends[-1]
+		return 0
+
+	def _findRange(self, offset: int) -> int:
+		if not 0 <= offset < len(self):
+			raise IndexError("Offset " + repr(offset) + " is out of [0, " + repr(len(self)) + ")")
+		return bisect_right(self.ends, offset)
+
+	def _rangeBeginning(self, rangeIdx: int) -> int:
+		if rangeIdx:
+			return self.ends[rangeIdx - 1]
+		return 0
+
+	def locate(self, offset: int) -> typing.Tuple[int, int]:
+		"""Returns the index of the range containing the logical `offset` and the physical position corresponding to it."""
+		i = self._findRange(offset)
+		s = self.ranges[i]
+		return i, s.start + (offset - self._rangeBeginning(i)) * _getStepForComputation(s)
+
+	def slice_logical(self, start: int, stop: int) -> SliceRangeListT:
+		"""Returns the physical ranges corresponding to the logical range `[start, stop)`. Their types and directions are the ones of the ranges they are cut from."""
+		start = max(start, 0)
+		stop = min(stop, len(self))
+		if start >= stop:
+			return ()
+
+		first = self._findRange(start)
+		last = self._findRange(stop - 1)
+		res = []
+		for i in range(first, last + 1):
+			s = self.ranges[i]
+			b = self._rangeBeginning(i)
+			lo = max(start, b) - b
+			hi = min(stop, self.ends[i]) - b
+			if lo < hi:
+				res.append(sAny2Type(slice2range(s)[lo:hi], s.__class__))
+		return tuple(res)
+
+	def locate_many(self, offsets: typing.Iterable[int]) -> typing.List[typing.Tuple[int, int]]:
+		return [self.locate(o) for o in offsets]
+
+	def slice_logical_many(self, bounds: typing.Iterable[typing.Tuple[int, int]]) -> typing.List[SliceRangeListT]:
+		return [self.slice_logical(start, stop) for start, stop in bounds]
@@ -0,0 +1,133 @@
+import typing
+import threading
+import multiprocessing
+
+from .utils import SliceRangeListT, SliceRangeT, isInstArg
+from .tree import LookupResult, RangesTree, _makeLeaf, _normBounds, mergeRangesInTreeLookupResult
+
+__all__ = ("PartitionedRangesIndex",)
+
+
+def _serveShard(conn: typing.Any, index: SliceRangeListT, data: typing.Optional[SliceRangeListT]) -> None:
+	"""The loop of a worker process: builds the tree of the shard and answers the queries until `None` is received."""
+	tree = RangesTree.build(index=index, data=data)
+	while True:
+		q = conn.recv()
+		if q is None:
+			break
+		try:
+			res = tuple((el.index, el.indexee) for el in tree[q])
+		except Exception as ex:  # pylint: disable=broad-except
+			conn.send((False, ex))
+		else:
+			conn.send((True, res))
+	conn.close()
+
+
+class PartitionedRangesIndex:
+
+	"""Splits a sorted sequence of ranges (and the data associated to them) into `shardsCount` contiguous shards of nearly equal count of ranges. Each shard is a `RangesTree` served by its own worker process. A query is sent only to the shards which extents overlap it, all of them work on it in parallel, then the results are gathered in order. Queries from multiple threads are serialized. Use it as a context manager or call `close` to stop the workers."""
+
+	__slots__ = ("bounds", "counts", "_conns", "_procs", "_lock")
+
+	def __init__(self, index: SliceRangeListT, data: typing.Optional[SliceRangeListT] = None, shardsCount: typing.Optional[int] = None, mpContext: typing.Optional[str] = None) -> None:
+		index, data = RangesTree.prepareBuildArgs(index, data)
+		if isinstance(index, isInstArg):
+			index = (index,)
+			if data is not None:
+				data = (data,)
+		if not len(index):
+			raise ValueError("Cannot partition an empty index")
+
+		if shardsCount is None:
+			shardsCount = multiprocessing.cpu_count()
+		shardsCount = max(1, min(shardsCount, len(index)))
+		ctx = multiprocessing.get_context(mpContext)
+
+		self.bounds = []
+		self.counts = []
+		self._conns = []
+		self._procs = []
+		self._lock = threading.Lock()
+
+		shardLen, rest = divmod(len(index), shardsCount)
+		b = 0
+		for i in range(shardsCount):
+			e = b + shardLen + (i < rest)
+			shardIndex = tuple(index[b:e])
+			shardData = tuple(data[b:e]) if data is not None else None
+
+			lo = min(_normBounds(el)[0] for el in shardIndex)
+			hi = max(_normBounds(el)[1] for el in shardIndex)
+			self.bounds.append((lo, hi))
+			self.counts.append(e - b)
+
+			parentConn, childConn = ctx.Pipe()
+			p = ctx.Process(target=_serveShard, args=(childConn, shardIndex, shardData), daemon=True)
+			p.start()
+			childConn.close()
+			self._conns.append(parentConn)
+			self._procs.append(p)
+			b = e
+
+	def __len__(self) -> int:
+		return sum(self.counts)
+
+	def shardsFor(self, q: typing.Union[SliceRangeT, int]) -> typing.List[int]:
+		"""Returns the indexes of the shards which extents overlap the query."""
+		if isinstance(q, int):
+			lo, hi = q, q + 1
+		else:
+			lo, hi = _normBounds(q)
+		return [i for i, (sLo, sHi) in enumerate(self.bounds) if sLo < hi and lo < sHi]
+
+	def _scatterGather(self, q: SliceRangeT) -> typing.Iterator[typing.Tuple[SliceRangeT, SliceRangeT]]:
+		if self._conns is None:
+			raise ValueError("The index is closed")
+
+		if isinstance(q, int):
+			q = range(q, q + 1)
+
+		shards = self.shardsFor(q)
+		with self._lock:
+			for i in shards:
+				self._conns[i].send(q)
+			replies = [self._conns[i].recv() for i in shards]
+
+		for isOk, res in replies:
+			if not isOk:
+				raise res
+			yield from res
+
+	def __getitem__(self, q: typing.Union[SliceRangeT, int]) -> LookupResult:
+		"""Returns the leaves overlapping the query from all the shards, in order."""
+		return (_makeLeaf(*p) for p in tuple(self._scatterGather(q)))
+
+	def get(self, q: typing.Union[SliceRangeT, int], merge: bool = False) -> LookupResult:
+		"""Like `__getitem__`, but with `merge` the adjacent leaves (including the ones from different shards) are merged with `mergeRangesInTreeLookupResult`."""
+		res = tuple(self[q])
+		if merge and res:
+			return mergeRangesInTreeLookupResult(res)
+		return iter(res)
+
+	def close(self) -> None:
+		"""Stops the worker processes."""
+		if self._conns is None:
+			return
+
+		for conn in self._conns:
+			try:
+				conn.send(None)
+			except (BrokenPipeError, OSError):
+				pass
+			conn.close()
+		for p in self._procs:
+			p.join()
+		self._conns = None
+		self._procs = None
+
+	def __enter__(self) -> "PartitionedRangesIndex":
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.close()
@@ -0,0 +1,187 @@
+"""Opt-in instrumentation. Nothing is patched until `profile` is entered, so when it is not used it costs nothing."""
+
+import typing
+import sys
+import inspect
+from time import perf_counter
+from functools import wraps
+from contextlib import contextmanager
+from collections import defaultdict
+
+from . import utils, diff, tree
+
+__all__ = ("Stats", "stats", "profile")
+
+INSTRUMENTED_MODULES = (utils, diff, tree)
+
+
+class Stats:
+	"""Counts calls and cumulative time of the public functions and the work done by the tree queries."""
+
+	__slots__ = ("calls", "time", "queries", "nodesVisited", "leavesMatched", "sdiffInvocations", "_queryDepth")
+
+	def __init__(self) -> None:
+		self.reset()
+
+	def reset(self) -> None:
+		self.calls = defaultdict(int)
+		self.time = defaultdict(float)
+		self.queries = 0
+		self.nodesVisited = 0
+		self.leavesMatched = 0
+		self.sdiffInvocations = 0
+		self._queryDepth = 0
+
+	def asDict(self) -> typing.Dict[str, typing.Any]:
+		q = self.queries
+		counters = {
+			"nodesVisited": self.nodesVisited,
+			"leavesMatched": self.leavesMatched,
+			"sdiffInvocations": self.sdiffInvocations,
+		}
+		return {
+			"calls": dict(self.calls),
+			"time": dict(self.time),
+			"queries": q,
+			"total": counters,
+			"perQuery": {k: (v / q if q else 0.) for k, v in counters.items()},
+		}
+
+
+stats = Stats()
+
+
+def _wrapFunc(name: str, f: typing.Callable) -> typing.Callable:
+	if inspect.isgeneratorfunction(f):
+		@wraps(f)
+		def w(*args, **kwargs):
+			stats.calls[name] += 1
+			g = f(*args, **kwargs)
+			while True:
+				t0 = perf_counter()
+				try:
+					v = next(g)
+				except StopIteration as ex:
+					stats.time[name] += perf_counter() - t0
+					return ex.value
+				stats.time[name] += perf_counter() - t0
+				yield v
+	else:
+		@wraps(f)
+		def w(*args, **kwargs):
+			stats.calls[name] += 1
+			t0 = perf_counter()
+			try:
+				return f(*args, **kwargs)
+			finally:
+				stats.time[name] += perf_counter() - t0
+
+	return w
+
+
+def _wrapSdiff(f: typing.Callable) -> typing.Callable:
+	@wraps(f)
+	def w(*args, **kwargs):
+		if stats._queryDepth:
+			stats.sdiffInvocations += 1
+		return f(*args, **kwargs)
+	return w
+
+
+def _wrapQuery(name: str, f: typing.Callable) -> typing.Callable:
+	f = _wrapFunc(name, f)
+
+	@wraps(f)
+	def w(*args, **kwargs):
+		if not stats._queryDepth:
+			stats.queries += 1
+		stats._queryDepth += 1
+		try:
+			return f(*args, **kwargs)
+		finally:
+			stats._queryDepth -= 1
+	return w
+
+
+def _wrapNodeGetPath(f: typing.Callable) -> typing.Callable:
+	@wraps(f)
+	def w(*args, **kwargs):
+		stats.nodesVisited += 1
+		yield from f(*args, **kwargs)
+	return w
+
+
+def _wrapLeafGetPath(f: typing.Callable) -> typing.Callable:
+	@wraps(f)
+	def w(*args, **kwargs):
+		stats.nodesVisited += 1
+		for el in f(*args, **kwargs):
+			stats.leavesMatched += 1
+			yield el
+	return w
+
+
+def _computeFuncWrappers() -> typing.Dict[typing.Callable, typing.Callable]:
+	res = {}
+	for m in INSTRUMENTED_MODULES:
+		modName = m.__name__.rsplit(".", 1)[-1]
+		for k in m.__all__:
+			v = getattr(m, k)
+			if inspect.isroutine(v) and v not in res:
+				res[v] = _wrapFunc(modName + "." + k, v)
+	res[diff.sdiff] = _wrapSdiff(res[diff.sdiff])
+	return res
+
+
+def _computeMethodWrappers() -> typing.Iterable[typing.Tuple[type, str, typing.Callable]]:
+	yield tree._RangesIndexTree, "getPath", _wrapNodeGetPath
+	yield tree.ILeaf, "getPath", _wrapLeafGetPath
+	for cls in (tree._RangesIndexTree, tree.RangesTree, tree._SliceSequence):
+		yield cls, "__getitem__", lambda f, cls=cls: _wrapQuery("tree." + cls.__name__ + ".__getitem__", f)
+
+
+_patched = []
+_activeCount = 0
+
+
+def _install() -> None:
+	funcWrappers = _computeFuncWrappers()
+	for modName, m in tuple(sys.modules.items()):
+		if m is None or (modName != __package__ and not modName.startswith(__package__ + ".")):
+			continue
+		d = m.__dict__
+		for k, v in tuple(d.items()):
+			if inspect.isroutine(v) and v in funcWrappers:
+				_patched.append((d, k, v))
+				d[k] = funcWrappers[v]
+
+	for cls, k, wrapperCtor in _computeMethodWrappers():
+		v = cls.__dict__[k]
+		_patched.append((cls, k, v))
+		setattr(cls, k, wrapperCtor(v))
+
+
+def _uninstall() -> None:
+	while _patched:
+		target, k, v = _patched.pop()
+		if isinstance(target, dict):
+			target[k] = v
+		else:
+			setattr(target, k, v)
+
+
+@contextmanager
+def profile(reset: bool = True) -> typing.Iterator[Stats]:
+	"""Enables the instrumentation within the context. Patches the package functions and methods in place, so it is not thread-safe and the other threads are also measured."""
+	global _activeCount
+	if reset and not _activeCount:
+		stats.reset()
+	if not _activeCount:
+		_install()
+	_activeCount += 1
+	try:
+		yield stats
+	finally:
+		_activeCount -= 1
+		if not _activeCount:
+			_uninstall()
@@ -1,12 +1,18 @@
 import typing
+import asyncio
+import heapq
+import itertools
+import threading
 from abc import ABC, abstractmethod
-from collections.abc import Mapping
+from collections.abc import Mapping, Sequence
 
-from .utils import SliceRangeListT, SliceRangeT, salign_, sAny2Type, sjoin_, slen, slice2range, soverlaps, isInstArg, _scollapse, ssegments_
+from .utils import SliceRangeListT, SliceRangeT, SliceRangeTypeT, salign_, sAny2Type, sjoin_, slen, slice2range, snormalize, soverlaps, sPointIn, isInstArg, _scollapse, _mk, ssegments_, SChunkRun, sexpand_
 from .utils import sjoin, soffset_split, salign  # pylint: disable=no-name-in-module
 from .diff import SDiffAutomata, sdiff, sdist, ssub
+from .cache import LRUCache
+from .interop import asRangeColumns
 
-__all__ = ("IndexProto", "KeyLeaf", "ValueLeaf", "_RangesTree", "RangesTree", "SliceSequence", "mergeRangesInTreeLookupResult", "FuzzySingleLookupResult", "SingleLookupResult")
+__all__ = ("IndexProto", "KeyLeaf", "ValueLeaf", "_RangesTree", "RangesTree", "SliceSequence", "mergeRangesInTreeLookupResult", "FuzzySingleLookupResult", "SingleLookupResult", "SnapshotRangesTree", "AggregatedRangesTree", "RangesTreeCursor", "CachedRangesTree")
 
 
 # pylint: disable=too-few-public-methods
@@ -37,6 +43,13 @@ class IndexProto(Mapping):
 	def __len__(self):
 		return 1
 
+	def cursor(self, pos: typing.Optional[int] = None) -> "RangesTreeCursor":
+		"""Returns a cursor at the first leaf, or, if `pos` is given, at the first leaf not entirely before `pos` in the direction of the tree."""
+		res = RangesTreeCursor(self)
+		if pos is not None:
+			res.seek(pos)
+		return res
+
 
 class NodeProto(IndexProto):
 	__slots__ = ()
@@ -68,14 +81,19 @@ class ILeaf(NodeProto):
 	def indexee(self) -> SliceRangeListT:
 		return self.index
 
-	def __getitem__(self, q: SliceRangeT) -> "LookupResult":
-		if soverlaps(self.index, q):
-			yield self
+	def __getitem__(self, q: typing.Union[SliceRangeT, int]) -> "LookupResult":
+		if isinstance(q, int):
+			return self.stab(q)
+		return iter((self,) if soverlaps(self.index, q) else ())
 
 	def getPath(self, q, path=()):
 		if soverlaps(self.index, q):
 			yield SingleLookupResult(self, path)
 
+	def stab(self, pt: int) -> "LookupResult":
+		if sPointIn(self.index, pt):
+			yield self
+
 
 LookupResult = typing.Iterable["ILeaf"]
 LookupPath = typing.Iterable[int]
@@ -144,6 +162,13 @@ class ValueLeaf(ILeaf):
 		self._indexee = v
 
 
+def _spanContains(s: SliceRangeT, pt: int) -> bool:
+	"""Checks if the point is within the bounds of the range/slice, ignoring the step. Used for the extents of the internal nodes, which steps are meaningless."""
+	if s.stop < s.start:
+		return s.stop < pt <= s.start
+	return s.start <= pt < s.stop
+
+
 def get_lowest_metered(cur, metric) -> LookupResult:
 	cur = (cur, None)
 	path = ()
@@ -158,6 +183,68 @@ def get_lowest_metered(cur, metric) -> LookupResult:
 	return FuzzySingleLookupResult(cur[0], path, cur[1])
 
 
+class _ArrayRowsSequence(Sequence):
+	"""Presents a 2D array of `(start, stop[, step])` rows as a sequence of ranges, creating them on access."""
+
+	__slots__ = ("rows", "tp")
+
+	def __init__(self, rows: typing.Any, tp: SliceRangeTypeT = range) -> None:
+		self.rows = rows
+		self.tp = tp
+
+	def __len__(self) -> int:
+		return len(self.rows)
+
+	def __getitem__(self, i: typing.Union[int, slice]) -> typing.Union[SliceRangeT, "_ArrayRowsSequence"]:
+		if isinstance(i, slice):
+			return self.__class__(self.rows[i], self.tp)
+		return _mk(self.tp, *(int(el) for el in self.rows[i]))
+
+
+def _asRangeSequence(seq: typing.Any) -> typing.Any:
+	"""Makes an index or data suitable for building a tree: iterators are materialized, 2D arrays are wrapped into `_ArrayRowsSequence`, pandas `IntervalIndex`es and Arrow columns are wrapped into `RangeColumns`, `SChunkRun`s are used as is (their chunks are created on access), the sequences containing them are expanded."""
+	if seq is None or isinstance(seq, (range, slice, SChunkRun)):
+		return seq
+	columns = asRangeColumns(seq)
+	if columns is not None:
+		return columns
+	if getattr(seq, "ndim", None) == 2:
+		return _ArrayRowsSequence(seq)
+	if not hasattr(seq, "__len__") or not hasattr(seq, "__getitem__"):
+		return tuple(sexpand_(seq))
+	if isinstance(seq, (tuple, list)) and any(isinstance(el, SChunkRun) for el in seq):
+		return tuple(sexpand_(seq))
+	return seq
+
+
+def _makeLeaf(k: SliceRangeT, v: SliceRangeT) -> ILeaf:
+	if k == v:
+		return KeyLeaf(k)
+	return ValueLeaf(k, v)
+
+
+def _drain(steps: typing.Generator[None, None, typing.Any]) -> typing.Any:
+	"""Runs a generator to the end and returns its return value."""
+	try:
+		while True:
+			next(steps)
+	except StopIteration as ex:
+		return ex.value
+
+
+def _replaceByPath(node: IndexProto, path: LookupPath, newNode: IndexProto) -> IndexProto:
+	"""Returns a copy of `node` in which the node at `path` is replaced with `newNode`. Only the nodes on the path are copied, all the other subtrees are shared with `node`."""
+	if not path:
+		return newNode
+
+	res = node.__class__()
+	children = list(node.children)
+	children[path[0]] = _replaceByPath(children[path[0]], path[1:], newNode)
+	res._left, res._right = children
+	res.updateRange()
+	return res
+
+
 class _RangesIndexTree(IndexProto):
 
 	"""Allows to store sequences of slices and then query the slices overlapping with the given slice. Returns the whole slices, not their parts."""
@@ -174,8 +261,8 @@ class _RangesIndexTree(IndexProto):
 	def updateRange(self) -> None:
 		if self._left is not None:
 			if self._right is not None:
-				ress = sjoin((self._left.index, self._right.index))
-				self.index = type(ress[0])(ress[0].start, ress[-1].stop, ress[0].step)
+				l = self._left.index
+				self.index = _mk(l.__class__, l.start, self._right.index.stop, l.step)
 			else:
 				self.index = self._left.index
 		else:
@@ -248,43 +335,98 @@ class _RangesIndexTree(IndexProto):
 		return res
 
 	@classmethod
-	def build(cls, index: SliceRangeListT, data: typing.Iterable[typing.Any]) -> typing.Union[ILeaf, "RangesTree"]:
-		assert len(index) == len(data)
-		return cls._build(index=index, ranges=ranges)
+	def _alignBuildArgs(cls, index: SliceRangeListT, data: typing.Optional[typing.Iterable[typing.Any]]) -> typing.Tuple[SliceRangeListT, typing.Optional[typing.Iterable[typing.Any]]]:
+		if data is not None:
+			assert len(index) == len(data)
+		return index, data
+
+	@classmethod
+	def prepareBuildArgs(cls, index: SliceRangeListT, data: typing.Optional[typing.Iterable[typing.Any]] = None) -> typing.Tuple[SliceRangeListT, typing.Optional[typing.Iterable[typing.Any]]]:
+		"""Converts `index` and `data` into indexable sequences and aligns them the way `build` does."""
+		return cls._alignBuildArgs(_asRangeSequence(index), _asRangeSequence(data))
+
+	@classmethod
+	def build(cls, index: SliceRangeListT, data: typing.Optional[typing.Iterable[typing.Any]] = None) -> typing.Union[ILeaf, "RangesTree"]:
+		"""Builds a balanced tree. `index` and `data` can also be iterators, 2D arrays of `(start, stop[, step])` rows, such as NumPy ones, pandas `IntervalIndex`es or Arrow struct arrays and tables with `start` and `stop` fields."""
+		index, data = cls.prepareBuildArgs(index, data)
+		return cls._build(index=index, data=data)
+
+	@classmethod
+	async def abuild(cls, index: SliceRangeListT, data: typing.Optional[typing.Iterable[typing.Any]] = None, yieldEvery: int = 1024) -> typing.Union[ILeaf, "RangesTree"]:
+		"""Async variant of `build`. Returns control to the event loop every `yieldEvery` created nodes."""
+		index, data = cls.prepareBuildArgs(index, data)
+		steps = cls._buildSteps(index=index, data=data)
+		created = 0
+		try:
+			while True:
+				next(steps)
+				created += 1
+				if created % yieldEvery == 0:
+					await asyncio.sleep(0)
+		except StopIteration as ex:
+			return ex.value
 
 	@classmethod
 	def _build(cls, index: SliceRangeListT, data: typing.Optional[typing.Iterable[typing.Any]] = None) -> typing.Union[KeyLeaf, "_RangesIndexTree"]:
+		"""Builds the balanced tree bottom-up in O(n): the leaves are addressed by indexes into `index` and `data`, nothing is sliced, the extent of each node is computed once from its children."""
 		#print(__class__.__name__ + ".build", "index=", index, "data=", data)
 
-		if not isinstance(index, isInstArg):
-			count = len(index)
-			root = cls()
-			if count > 1:
-				mid = count // 2
-				leftIdx, rightIdx = index[:mid], index[mid:]
-				if len(leftIdx) == 1:
-					leftIdx = leftIdx[0]
-				if len(rightIdx) == 1:
-					rightIdx = rightIdx[0]
-
-				#print("mid=", mid, "ranges=", ranges)
-				if data is not None:
-					leftRngs, rightRngs = data[:mid], data[mid:]
-					#print("leftRngs=",leftRngs, "rightRngs=",rightRngs)
-				else:
-					leftRngs, rightRngs = None, None
+		return _drain(cls._buildSteps(index=index, data=data))
 
-				root.left = cls._build(index=leftIdx, data=leftRngs)
-				root.right = cls._build(index=rightIdx, data=rightRngs)
-				return root
-		else:
-			index = (index,)
+	@classmethod
+	def _buildSteps(cls, index: SliceRangeListT, data: typing.Optional[typing.Iterable[typing.Any]] = None) -> typing.Generator[None, None, typing.Union[KeyLeaf, "_RangesIndexTree"]]:
+		"""Like `_build`, but yields after creation of every node and returns the root."""
+		if isinstance(index, isInstArg):
+			yield
+			return cls._makeSingleLeaf(index, data)
+		return (yield from cls._buildStepsFromLeaves(len(index), cls._leafMaker(index, data)))
 
+	@classmethod
+	def _makeSingleLeaf(cls, index: SliceRangeT, data: typing.Optional[typing.Iterable[typing.Any]]) -> ILeaf:
 		if data:
-			data = _scollapse(data)
-			return cls.INDEX_NODE(index[0], data)
+			return cls.INDEX_NODE(index, _scollapse(data))
+		return cls.INDEX_NODE.KEY_LEAF_TYPE(index)
 
-		return cls.INDEX_NODE.KEY_LEAF_TYPE(index[0])
+	@classmethod
+	def _leafMaker(cls, index: SliceRangeListT, data: typing.Optional[typing.Iterable[typing.Any]]) -> typing.Callable[[int], ILeaf]:
+		if data:
+			def makeLeaf(i: int) -> ILeaf:
+				return cls.INDEX_NODE(index[i], data[i])
+		else:
+			def makeLeaf(i: int) -> ILeaf:
+				return cls.INDEX_NODE.KEY_LEAF_TYPE(index[i])
+		return makeLeaf
+
+	@classmethod
+	def _buildFromLeaves(cls, count: int, makeLeaf: typing.Callable[[int], ILeaf]) -> typing.Union[ILeaf, "_RangesIndexTree"]:
+		return _drain(cls._buildStepsFromLeaves(count, makeLeaf))
+
+	@classmethod
+	def _buildStepsFromLeaves(cls, count: int, makeLeaf: typing.Callable[[int], ILeaf]) -> typing.Generator[None, None, typing.Union[ILeaf, "_RangesIndexTree"]]:
+		"""Post-order traversal of the implicit balanced tree over `range(count)` with an explicit stack. Each range `[lo, hi)` is split at `lo + (hi - lo) // 2`. Yields after creation of every node and returns the root."""
+		if not count:
+			raise ValueError("Cannot build a tree without leaves")
+		stack = [(0, count, False)]
+		built = []
+		while stack:
+			lo, hi, childrenBuilt = stack.pop()
+			if hi - lo == 1:
+				built.append(makeLeaf(lo))
+			elif not childrenBuilt:
+				mid = lo + (hi - lo) // 2
+				stack.append((lo, hi, True))
+				stack.append((mid, hi, False))
+				stack.append((lo, mid, False))
+				continue
+			else:
+				node = cls()
+				node._right = built.pop()
+				node._left = built.pop()
+				node.updateRange()
+				built.append(node)
+			yield
+
+		return built[0]
 
 	def getPath(self, q, path=()):
 		if soverlaps(self.index, q):
@@ -295,6 +437,75 @@ class _RangesIndexTree(IndexProto):
 		for el in self.getPath(q):
 			yield el.node
 
+	async def agetPath(self, q: SliceRangeT, yieldEvery: int = 64) -> typing.AsyncIterator[SingleLookupResult]:
+		"""Async variant of `getPath`. Returns control to the event loop every `yieldEvery` visited nodes."""
+		stack = [(self, ())]
+		visited = 0
+		while stack:
+			node, path = stack.pop()
+			visited += 1
+			if visited % yieldEvery == 0:
+				await asyncio.sleep(0)
+
+			if soverlaps(node.index, q):
+				if isinstance(node, ILeaf):
+					yield SingleLookupResult(node, path)
+				else:
+					for i in (1, 0):
+						stack.append((node.children[i], path + (i,)))
+
+	async def aget(self, q: SliceRangeT, yieldEvery: int = 64) -> typing.AsyncIterator[ILeaf]:
+		"""Async variant of `__getitem__`. Returns control to the event loop every `yieldEvery` visited nodes."""
+		async for el in self.agetPath(q, yieldEvery):
+			yield el.node
+
+	def stab(self, pt: int) -> LookupResult:
+		"""Returns the leaves containing the point `pt`. Descends only into the children which extents contain the point, without constructing a query range, so when the leaves don't overlap it is O(log n)."""
+		stack = [self]
+		while stack:
+			node = stack.pop()
+			if isinstance(node, ILeaf):
+				if sPointIn(node.index, pt):
+					yield node
+			elif _spanContains(node.index, pt):
+				stack.append(node._right)
+				stack.append(node._left)
+
+	def stab_many(self, points: typing.Iterable[int]) -> typing.Any:
+		"""Returns the in-order indexes of the leaves containing the points, `None` for the points not covered by any leaf. The points are sorted and swept over the leaves once, so the leaves must not overlap each other. For a numpy array of points the sweep is vectorized with `searchsorted` and an array is returned, -1 marks the points not covered."""
+		bounds = [slice2range(l.index) for l in self]
+		bounds = [b if b.step > 0 else b[::-1] for b in bounds]
+		isRev = self.index.stop < self.index.start
+		if isRev:
+			bounds.reverse()
+		lastIdx = len(bounds) - 1
+
+		if getattr(points, "ndim", None) is not None:
+			import numpy as np
+
+			los = np.array([b.start for b in bounds])
+			his = np.array([b.stop for b in bounds])
+			steps = np.array([b.step for b in bounds])
+			found = np.searchsorted(los, points, side="right") - 1
+			idx = np.maximum(found, 0)
+			hit = (found >= 0) & (points < his[idx]) & ((points - los[idx]) % steps[idx] == 0)
+			if isRev:
+				idx = lastIdx - idx
+			return np.where(hit, idx, -1)
+
+		points = list(points)
+		res = [None] * len(points)
+		j = 0
+		for k in sorted(range(len(points)), key=points.__getitem__):
+			p = points[k]
+			while j <= lastIdx and bounds[j].stop <= p:
+				j += 1
+			if j > lastIdx:
+				break
+			if p in bounds[j]:
+				res[k] = lastIdx - j if isRev else j
+		return res
+
 	def getByPath(self, path):
 		cur = self
 		for el in path:
@@ -324,10 +535,7 @@ class _RangesIndexTree(IndexProto):
 					# intersecting leaf is not found, found closest leaf. We spawn a new node and create a subtree.
 
 					newParent = self.__class__()
-					if k == v:
-						newLeaf = KeyLeaf(k)
-					else:
-						newLeaf = ValueLeaf(k, v)
+					newLeaf = _makeLeaf(k, v)
 					if nod.index.start < k.start:
 						newParent.children = (nod, newLeaf)
 					else:
@@ -341,7 +549,7 @@ class _RangesIndexTree(IndexProto):
 					if el.node.index == k:
 						if isinstance(el.node, ValueLeaf):
 							el.node.indexee = v
-						elif sinstance(el.node, KeyLeaf):
+						elif isinstance(el.node, KeyLeaf):
 							replacementLeaf = ValueLeaf(k, v)
 							parent.setChild(el.path[-1], replacementLeaf)
 						else:
@@ -396,6 +604,30 @@ class _RangesIndexTree(IndexProto):
 		#	els[0].indexee =
 		#print("aligned", index, ranges, k)
 
+	def setPersistent(self, k: SliceRangeT, v: SliceRangeT) -> "_RangesIndexTree":
+		"""Like `__setitem__`, but never mutates the tree. Returns a new root, sharing all the unchanged subtrees with this one (path copying)."""
+		els = self.get_closest(k)
+		if len(els) != 1:
+			raise NotImplementedError("Value set overlaps multiple leaves: " + repr(els) + ". Not yet implemented, set the leaves individually.")
+
+		el = els[0]
+		nod = el.node
+		newLeaf = _makeLeaf(k, v)
+
+		if isinstance(el, FuzzySingleLookupResult):
+			newNode = self.__class__()
+			if nod.index.start < k.start:
+				newNode._left, newNode._right = nod, newLeaf
+			else:
+				newNode._left, newNode._right = newLeaf, nod
+			newNode.updateRange()
+		elif nod.index == k:
+			newNode = newLeaf
+		else:
+			raise NotImplementedError("Setting a range partially overlapping a leaf is not yet implemented in persistent mode: " + repr(nod))
+
+		return _replaceByPath(self, el.path, newNode)
+
 
 class _RangesTree(_RangesIndexTree):
 
@@ -404,7 +636,7 @@ class _RangesTree(_RangesIndexTree):
 	__slots__ = ()
 
 	@classmethod
-	def build(cls, index: SliceRangeListT, data: typing.Optional[SliceRangeListT] = None) -> typing.Union[ILeaf, "RangesTree"]:
+	def _alignBuildArgs(cls, index: SliceRangeListT, data: typing.Optional[SliceRangeListT]) -> typing.Tuple[SliceRangeListT, typing.Optional[SliceRangeListT]]:
 		if data:
 			rangesIsRange = isinstance(data, isInstArg)
 			indexIsRange = isinstance(index, isInstArg)
@@ -412,25 +644,387 @@ class _RangesTree(_RangesIndexTree):
 				index, data = salign((index, data))
 				#print("aligned", index, ranges)
 
-		return cls._build(index=index, data=data)
+		return index, data
+
+
+class RangesTreeCursor:
+
+	"""Walks the leaves of a tree in order. Keeps the path from the root to the current leaf in an explicit stack, so `seek` is O(log n) and `next` and `prev` are amortized O(1). Falling off an end makes `current` `None`, stepping back from there returns to the last (or the first) leaf. The tree must not be modified while the cursor is used."""
+
+	__slots__ = ("root", "_path", "_leaf", "_offEnd", "_isNeg")
+
+	def __init__(self, root: IndexProto) -> None:
+		self.root = root
+		self._isNeg = root.index.stop < root.index.start
+		self._path = []
+		self._leaf = None
+		self._offEnd = 0
+		self._descend(root, 0)
+
+	@property
+	def current(self) -> typing.Optional[ILeaf]:
+		return self._leaf
+
+	def _descend(self, node: IndexProto, side: int) -> ILeaf:
+		"""Goes down to the leftmost (`side == 0`) or the rightmost (`side == 1`) leaf of the subtree."""
+		path = self._path
+		while not isinstance(node, ILeaf):
+			path.append((node, side))
+			node = node._right if side else node._left
+		self._leaf = node
+		self._offEnd = 0
+		return node
+
+	def _isBefore(self, s: SliceRangeT, pos: int) -> bool:
+		if self._isNeg:
+			return s.stop >= pos
+		return s.stop <= pos
+
+	def seek(self, pos: int) -> typing.Optional[ILeaf]:
+		"""Moves to the first leaf not entirely before `pos` in the direction of the tree and returns it."""
+		self._path = path = []
+		node = self.root
+		while not isinstance(node, ILeaf):
+			if self._isBefore(node._left.index, pos):
+				path.append((node, 1))
+				node = node._right
+			else:
+				path.append((node, 0))
+				node = node._left
+
+		self._leaf = node
+		self._offEnd = 0
+		if self._isBefore(node.index, pos):
+			return self.next()
+		return node
+
+	def _step(self, side: int) -> typing.Optional[ILeaf]:
+		if self._offEnd:
+			if self._offEnd == (-1 if side else 1):
+				self._path = []
+				return self._descend(self.root, 1 - side)
+			return None
+
+		path = self._path
+		while path and path[-1][1] == side:
+			path.pop()
+
+		if not path:
+			self._leaf = None
+			self._offEnd = 1 if side else -1
+			return None
+
+		node, _ = path.pop()
+		path.append((node, side))
+		return self._descend(node._right if side else node._left, 1 - side)
+
+	def next(self) -> typing.Optional[ILeaf]:
+		"""Moves to the next leaf and returns it."""
+		return self._step(1)
+
+	def prev(self) -> typing.Optional[ILeaf]:
+		"""Moves to the previous leaf and returns it."""
+		return self._step(0)
+
+	def __iter__(self) -> typing.Iterator[ILeaf]:
+		"""Yields the leaves from the current one to the end, moving the cursor."""
+		leaf = self._leaf
+		while leaf is not None:
+			yield leaf
+			leaf = self.next()
+
+
+def _normBounds(s: SliceRangeT) -> typing.Tuple[int, int]:
+	n = slice2range(snormalize(s))
+	return n.start, n.stop
+
+
+QueryKeyT = typing.Tuple[int, int, SliceRangeTypeT, bool]
+
+
+def _queryKey(q: SliceRangeT) -> QueryKeyT:
+	"""A key of a query in a results cache: its normalized bounds, its type and its direction."""
+	lo, hi = _normBounds(q)
+	return lo, hi, q.__class__, q.stop < q.start
+
+
+def _discardOverlappingQueries(cache: typing.Optional[LRUCache], bounds: typing.Tuple[int, int]) -> None:
+	if cache is not None:
+		lo, hi = bounds
+		cache.discardIf(lambda key: key[0] < hi and lo < key[1])
 
 
 class RangesTree(_RangesTree):
 	__slots__ = ()
 
+	def _affectedBounds(self, k: SliceRangeT) -> typing.Tuple[int, int]:
+		"""The bounds of the area which lookups results can be changed by setting `k`: `k` itself and the leaves overlapping it, which indexes may be modified."""
+		lo, hi = _normBounds(k)
+		for el in super().__getitem__(k):
+			elLo, elHi = _normBounds(el.index)
+			lo = min(lo, elLo)
+			hi = max(hi, elHi)
+		return lo, hi
+
 	def __getitem__(self, q: typing.Union[SliceRangeT, int]) -> LookupResult:
 		if isinstance(q, int):
-			q = type(self.range)(q, q + 1)
+			return self.stab(q)
 		return super().__getitem__(q)
 
+	@classmethod
+	def merge(cls, a: IndexProto, b: IndexProto, resolve: typing.Optional[typing.Callable[[ILeaf, ILeaf], typing.Union[ILeaf, typing.Iterable[ILeaf]]]] = None) -> typing.Union[ILeaf, "RangesTree"]:
+		"""Merges the leaves of 2 trees of the same direction into a new balanced tree in O(n + m): the leaves are merged in order in a single pass, then the tree is bulk-loaded. When a leaf overlaps the previous one, `resolve(previous, leaf)` is called and its result (a leaf or an ordered iterable of leaves) replaces both. By default equal leaves are deduplicated and other overlaps raise `ValueError`. The leaves are copied, the input trees are not modified. A tree cannot be empty, so if `resolve` drops all the leaves `ValueError` is raised."""
+		isNeg = a.index.stop < a.index.start
+		if isNeg != (b.index.stop < b.index.start):
+			raise ValueError("Cannot merge trees of different directions")
+
+		if isNeg:
+			def getKey(leaf: ILeaf) -> int:
+				return -_normBounds(leaf.index)[1]
+		else:
+			def getKey(leaf: ILeaf) -> int:
+				return _normBounds(leaf.index)[0]
+
+		leaves = []
+		last = None
+		lastBounds = None
+		for leaf in heapq.merge(a, b, key=getKey):
+			bounds = _normBounds(leaf.index)
+			if last is not None and bounds[0] < lastBounds[1] and lastBounds[0] < bounds[1]:
+				if resolve is None:
+					if last.cmpTuple() == leaf.cmpTuple():
+						continue
+					raise ValueError("Leaves overlap: " + repr(last) + " and " + repr(leaf) + ", pass `resolve`")
+
+				resolved = resolve(last, leaf)
+				if isinstance(resolved, ILeaf):
+					resolved = (resolved,)
+				resolved = list(resolved)
+				if not resolved:
+					last = None
+					continue
+				leaves.extend(resolved[:-1])
+				leaf = resolved[-1]
+				bounds = _normBounds(leaf.index)
+			elif last is not None:
+				leaves.append(last)
+			last = leaf
+			lastBounds = bounds
+
+		if last is not None:
+			leaves.append(last)
+
+		if not leaves:
+			raise ValueError("The merge is empty: `resolve` has dropped all the leaves")
+		leaves = [_makeLeaf(el.index, el.indexee) for el in leaves]
+		return cls._buildFromLeaves(len(leaves), leaves.__getitem__)
+
+
+def _sclip(s: SliceRangeT, lo: int, hi: int) -> range:
+	"""Returns the positive-directed range of the points of `s` within `[lo, hi)`."""
+	n = slice2range(snormalize(s))
+	step = n.step
+	i0 = max(0, -((n.start - lo) // step))
+	i1 = max(0, -((n.start - hi) // step))
+	return n[i0:i1]
+
+
+class AggregatedRangesTree(RangesTree):
+
+	"""A `RangesTree` which nodes keep aggregates of their subtrees: the count of leaves, the total length of their indexes and a value of a monoid. The monoid is defined by overriding `IDENTITY`, `leafValue` and `combine`. The aggregates of a query are computed in O(log n) without materializing the overlapping leaves: only the nodes on the boundaries of the query are descended into."""
+
+	__slots__ = ("count", "length", "value")
+
+	IDENTITY = None
+
+	@staticmethod
+	def leafValue(leaf: ILeaf, part: range) -> typing.Any:
+		"""Value of the monoid for the `part` of the `leaf` index. `part` is positive-directed."""
+		return None
+
+	@staticmethod
+	def combine(a: typing.Any, b: typing.Any) -> typing.Any:
+		return None
+
+	def __init__(self) -> None:
+		super().__init__()
+		self.count = 0
+		self.length = 0
+		self.value = self.__class__.IDENTITY
+
+	def _childAggregates(self, ch: IndexProto) -> typing.Tuple[int, int, typing.Any]:
+		if isinstance(ch, ILeaf):
+			part = slice2range(snormalize(ch.index))
+			return 1, len(part), self.__class__.leafValue(ch, part)
+		return ch.count, ch.length, ch.value
+
+	def updateRange(self) -> None:
+		super().updateRange()
+		cls = self.__class__
+		count, length, value = 0, 0, cls.IDENTITY
+		for ch in self.children:
+			if ch is not None:
+				c, l, v = self._childAggregates(ch)
+				count += c
+				length += l
+				value = cls.combine(value, v)
+		self.count, self.length, self.value = count, length, value
+
+	def _aggregate(self, lo: int, hi: int) -> typing.Tuple[int, int, typing.Any]:
+		cls = self.__class__
+		count, length, value = 0, 0, cls.IDENTITY
+		for ch in self.children:
+			if ch is None:
+				continue
+			chLo, chHi = _normBounds(ch.index)
+			if chHi <= lo or chLo >= hi:
+				continue
+			if isinstance(ch, ILeaf):
+				part = _sclip(ch.index, lo, hi)
+				if not part:
+					count += 1
+					continue
+				c, l, v = 1, len(part), cls.leafValue(ch, part)
+			elif lo <= chLo and chHi <= hi:
+				c, l, v = ch.count, ch.length, ch.value
+			else:
+				c, l, v = ch._aggregate(lo, hi)
+			count += c
+			length += l
+			value = cls.combine(value, v)
+		return count, length, value
+
+	def __setitem__(self, k: SliceRangeT, v: SliceRangeT) -> None:
+		"""Sets the leaf, then recomputes the aggregates of all the nodes on the paths to it bottom-up, since a leaf can be mutated in place or replaced under a node which ancestors are not notified."""
+		super().__setitem__(k, v)
+		nodes = {}
+		for el in self.getPath(k):
+			for depth, node in enumerate(self.getNodesInPath(el.path[:-1])):
+				nodes[id(node)] = (depth, node)
+		for _, node in sorted(nodes.values(), key=lambda p: p[0], reverse=True):
+			node.updateRange()
+
+	def covered_length(self, q: SliceRangeT) -> int:
+		"""Count of the points of the indexes of the leaves within `q`. Unlike `count_overlapping` the strides are taken into account."""
+		return self._aggregate(*_normBounds(q))[1]
+
+	def count_overlapping(self, q: SliceRangeT) -> int:
+		"""Count of the leaves overlapping `q`, the same leaves `__getitem__` returns: the extents of the strided leaves are treated as contiguous, so a leaf is counted even if `q` falls between its points."""
+		return self._aggregate(*_normBounds(q))[0]
+
+	def reduce(self, q: SliceRangeT) -> typing.Any:
+		"""Combines the monoid values of the parts of the leaves within `q`."""
+		return self._aggregate(*_normBounds(q))[2]
+
+
+class SnapshotRangesTree:
+
+	"""Holds a `RangesTree` updated in copy-on-write manner. Readers take `snapshot`s which are never mutated, so they need no locks. Writers are serialized with a lock and publish a new root atomically."""
+
+	__slots__ = ("_root", "_lock")
+
+	def __init__(self, tree: RangesTree) -> None:
+		self._root = tree
+		self._lock = threading.Lock()
+
+	@property
+	def snapshot(self) -> RangesTree:
+		return self._root
+
+	def __getitem__(self, q: typing.Union[SliceRangeT, int]) -> LookupResult:
+		return self._root[q]
+
+	def __setitem__(self, k: SliceRangeT, v: SliceRangeT) -> None:
+		with self._lock:
+			self._root = self._root.setPersistent(k, v)
+
+	def __iter__(self):
+		return iter(self._root)
+
+	def __len__(self):
+		return len(self._root)
+
+
+class CachedRangesTree:
+
+	"""Wraps a `RangesTree` and caches the results of the range queries to it in a bounded LRU cache keyed by the normalized query. Setting an item through the wrapper drops only the cached queries overlapping the modified leaves. The cache lives only in the wrapper, the nodes of the tree are not touched, so the tree must be modified only through the wrapper while it is used."""
+
+	__slots__ = ("tree", "_queryCache")
+
+	def __init__(self, tree: RangesTree, maxSize: int = 256) -> None:
+		self.tree = tree
+		self._queryCache = LRUCache(maxSize)
+
+	@property
+	def queryCache(self) -> LRUCache:
+		"""The cache, use it to get the hit rate statistics."""
+		return self._queryCache
+
+	def _affectedBounds(self, k: SliceRangeT) -> typing.Tuple[int, int]:
+		return self.tree._affectedBounds(k)
+
+	def __getitem__(self, q: typing.Union[SliceRangeT, int]) -> LookupResult:
+		if isinstance(q, int):
+			return self.tree.stab(q)
+
+		cache = self._queryCache
+		key = _queryKey(q)
+		res = cache.get(key)
+		if res is None:
+			res = tuple(self.tree[q])
+			cache[key] = res
+		return iter(res)
+
+	def __setitem__(self, k: SliceRangeT, v: SliceRangeT) -> None:
+		bounds = self.tree._affectedBounds(k)
+		self.tree[k] = v
+		_discardOverlappingQueries(self._queryCache, bounds)
+
+	def __iter__(self):
+		return iter(self.tree)
+
+	def __len__(self):
+		return len(self.tree)
+
 
 class _SliceSequence:
-	__slots__ = ("tree",)
+	__slots__ = ("tree", "_queryCache")
 
 	def __init__(self, tree: RangesTree) -> None:
 		self.tree = tree
+		self._queryCache = None
+
+	def enableQueryCache(self, maxSize: int = 256) -> LRUCache:
+		"""Caches the trimmed `(index, value)` pairs of the lookups in a bounded LRU cache keyed by the normalized query. Setting an item drops only the cached queries overlapping the modified leaves. Returns the cache, use it to get the hit rate statistics."""
+		self._queryCache = LRUCache(maxSize)
+		return self._queryCache
+
+	def disableQueryCache(self) -> None:
+		self._queryCache = None
+
+	@property
+	def queryCache(self) -> typing.Optional[LRUCache]:
+		return self._queryCache
 
 	def __getitem__(self, q: SliceRangeT) -> LookupResult:
+		cache = self._queryCache
+		if cache is None:
+			return (ValueLeaf(*p) for p in self._lookup(q))
+
+		key = _queryKey(q)
+		res = cache.get(key)
+		if res is None:
+			res = tuple(self._lookup(q))
+			cache[key] = res
+		return (ValueLeaf(*p) for p in res)
+
+	def __setitem__(self, k: SliceRangeT, v: SliceRangeT) -> None:
+		bounds = self.tree._affectedBounds(k) if self._queryCache is not None else None
+		self.tree[k] = v
+		if bounds is not None:
+			_discardOverlappingQueries(self._queryCache, bounds)
+
+	def _lookup(self, q: SliceRangeT) -> typing.Iterator[typing.Tuple[SliceRangeT, SliceRangeT]]:
 		res = list(self.tree[q])
 		#print("res", res)
 		idxz = []
@@ -464,7 +1058,7 @@ class _SliceSequence:
 			valuez.append(val)
 
 		#print("idx", idx, "idxz", idxz, "valuez", valuez)
-		return (ValueLeaf(*p) for p in zip(idxz, valuez))
+		return zip(idxz, valuez)
 
 
 class SliceSequence(_SliceSequence):
@@ -477,6 +1071,71 @@ class SliceSequence(_SliceSequence):
 		#print("SliceSequence.__init__", "data=", data, "index=", index)
 		super().__init__(RangesTree.build(index=index, data=data))
 
+	def pairs(self) -> typing.Iterator[typing.Tuple[SliceRangeT, SliceRangeT]]:
+		"""Iterates `(index, value)` pairs of the leaves in order."""
+		for el in self.tree:
+			yield el.index, el.indexee
+
+	def compose(self, other: "SliceSequence") -> "SliceSequence":
+		"""Returns a mapping equivalent to looking up in `self` and then looking the results up in `other`. The values of `self` and the index of `other` are merged in a single pass over both sorted by their starts, without tree lookups. The parts of the values of `self` missing in `other` are dropped. A sequence cannot be empty, so if nothing is left `ValueError` is raised."""
+		mine = sorted(((_normBounds(b), i, a, b) for i, (a, b) in enumerate(self.pairs())), key=_getMergeKey)
+		theirs = sorted(((_normBounds(b), b, c) for b, c in other.pairs()), key=_getMergeKey)
+
+		pieces = []
+		j = 0
+		for (bLo, bHi), i, a, b in mine:
+			while j < len(theirs) and theirs[j][0][1] <= bLo:
+				j += 1
+
+			rb = slice2range(b)
+			for (b2Lo, b2Hi), b2, c in itertools.islice(theirs, j, None):
+				if b2Lo >= bHi:
+					break
+
+				i0, i1 = _indicesWithin(rb, max(bLo, b2Lo), min(bHi, b2Hi))
+				if i0 >= i1:
+					continue
+
+				rb2 = slice2range(b2)
+				rc = slice2range(c)
+				j0 = (rb[i0] - rb2.start) // rb2.step
+				j1 = (rb[i1 - 1] - rb2.start) // rb2.step
+				if j0 <= j1:
+					cPiece = rc[j0: j1 + 1]
+				else:
+					cPiece = rc[j1: j0 + 1][::-1]
+
+				pieces.append(((i, i0), sAny2Type(slice2range(a)[i0:i1], a.__class__), sAny2Type(cPiece, c.__class__)))
+
+		if not pieces:
+			raise ValueError("The composition is empty: no value of the sequence overlaps the index of the other one")
+		pieces.sort(key=_getMergeKey)
+		return self.__class__(index=tuple(p[1] for p in pieces), data=tuple(p[2] for p in pieces))
+
+	def invert(self) -> "SliceSequence":
+		"""Returns the inverse mapping. The values of `self` must not overlap and must be of the same direction."""
+		pairs = sorted(((_normBounds(b)[0], b, a) for a, b in self.pairs()), key=_getMergeKey)
+		if pairs and pairs[0][1].stop < pairs[0][1].start:
+			pairs.reverse()
+		return self.__class__(index=tuple(p[1] for p in pairs), data=tuple(p[2] for p in pairs))
+
+
+def _getMergeKey(p: typing.Tuple[typing.Any, ...]) -> typing.Any:
+	return p[0]
+
+
+def _indicesWithin(r: range, lo: int, hi: int) -> typing.Tuple[int, int]:
+	"""Returns `[i0, i1)` such that `r[i0:i1]` are exactly the points of `r` within `[lo, hi)`."""
+	step = r.step
+	if step > 0:
+		i0 = -((r.start - lo) // step)
+		i1 = -((r.start - hi) // step)
+	else:
+		i0 = (r.start - hi) // -step + 1
+		i1 = (r.start - lo) // -step + 1
+	l = len(r)
+	return min(max(i0, 0), l), min(max(i1, 0), l)
+
 
 def mergeRangesInTreeLookupResult(lookupResults: LookupResult) -> LookupResult:
 	idxz, valuez = zip(*((s.index, s.indexee) for s in lookupResults))
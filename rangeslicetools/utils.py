@@ -4,7 +4,9 @@ from collections.abc import Sequence
 from functools import wraps
 import heapq
 
-__all__ = ("SliceRangeT", "SliceRangeTypeT", "SliceRangeSeqT", "SliceRangeListT", "sAny2Type", "range2slice", "slice2range", "slen", "sdir", "svec", "srev", "sdirect", "snormalize", "ssplit_1_", "ssplit_1", "ssplit_", "ssplit", "schunks_", "schunks", "soffset_split_", "soffset_split", "sjoin_", "swithin", "soverlaps", "teeSliceSequences", "salign_", "sPointIn", "ssegments_", "ssegments")
+from .cache import LRUCache
+
+__all__ = ("SliceRangeT", "SliceRangeTypeT", "SliceRangeSeqT", "SliceRangeListT", "sAny2Type", "range2slice", "slice2range", "slen", "sdir", "svec", "srev", "sdirect", "snormalize", "ssplit_1_", "ssplit_1", "ssplit_", "ssplit", "schunks_", "schunks", "SChunkRun", "sexpand_", "soffset_split_", "soffset_split", "sjoin_", "Coalescer", "scoalesce_", "swithin", "soverlaps", "teeSliceSequences", "salign_", "sPointIn", "ssegments_", "ssegments", "enableInterning", "disableInterning", "getInterning")
 
 isInstArg = (range, slice)
 SliceRangeT = typing.Union[isInstArg]
@@ -40,9 +42,44 @@ def _scollapse(slc: SliceRangeOptListT) -> SliceRangeOptListT:
 	return slc
 
 
+_internPool = None
+
+
+def enableInterning(maxSize: int = 65536) -> LRUCache:
+	"""Makes the ranges/slices created by the functions of `utils` and by the trees to be taken from a pool, so the equal ones are the same object. `range` and `slice` cannot be weakly referenced, so the pool is a bounded LRU cache keyed by the type and `(start, stop, step)`. Returns the pool, use it to get the statistics or to clear it."""
+	global _internPool
+	_internPool = LRUCache(maxSize)
+	return _internPool
+
+
+def disableInterning() -> None:
+	global _internPool
+	_internPool = None
+
+
+def getInterning() -> typing.Optional[LRUCache]:
+	return _internPool
+
+
+def _mk(tp: SliceRangeTypeT, *args: int) -> SliceRangeT:
+	"""Creates a range/slice, taking it from the interning pool if it is enabled."""
+	pool = _internPool
+	if pool is None:
+		return tp(*args)
+
+	key = (tp, *args)
+	res = pool.get(key)
+	if res is None:
+		res = tp(*args)
+		pool[key] = res
+	return res
+
+
 def sAny2Type(rng: SliceRangeT, tp: SliceRangeTypeT) -> SliceRangeT:
-	"""Creates a new /range/slice with needed type"""
-	return tp(rng.start, rng.stop, _getStepForComputation(rng))
+	"""Creates a new /range/slice with needed type. Returns `rng` itself if it already has the type and an explicit step."""
+	if rng.__class__ is tp and rng.step is not None:
+		return rng
+	return _mk(tp, rng.start, rng.stop, _getStepForComputation(rng))
 
 
 def range2slice(rng: SliceRangeT) -> slice:
@@ -63,9 +100,14 @@ def slen(slcs: typing.Iterable[SliceRangeT]) -> int:
 	"""Returns length of a range/slice."""
 	if isinstance(slcs, isInstArg):
 		return _slen(slcs)
+	if isinstance(slcs, SChunkRun):
+		return slcs.pointsCount
 	total = 0
 	for s in slcs:
-		total += _slen(s)
+		if isinstance(s, SChunkRun):
+			total += s.pointsCount
+		else:
+			total += _slen(s)
 	return total
 
 
@@ -83,7 +125,7 @@ def srev(slc: SliceRangeT) -> SliceRangeT:
 	step = _getStepForComputation(slc)
 	newStep = -1 * step
 	assert isinstance(slc, range) or newStep >= -1, "Negative-directed slices with `step`s other -1 don't work!"
-	return slc.__class__(slc.stop - step, slc.start - step, newStep)
+	return _mk(slc.__class__, slc.stop - step, slc.start - step, newStep)
 
 
 def _isNegative(slcs: SliceRangeListT) -> typing.Iterable[bool]:
@@ -103,9 +145,16 @@ def _sdirect(donorNegative: bool, acceptor: SliceRangeOptListT) -> SliceRangeOpt
 	return acceptor
 
 
-def sPointIn(s: SliceRangeT, pt: int):
-	#return (((s.step is None or s.step > 0) and s.start <= pt < s.stop) or (s.start >= pt > s.stop))
-	return pt in slice2range(s)
+def sPointIn(s: SliceRangeT, pt: int) -> bool:
+	"""Checks if the point is one of the points of the range/slice. Pure arithmetic, no range is constructed."""
+	step = _getStepForComputation(s)
+	start = s.start
+	if step > 0:
+		if not start <= pt < s.stop:
+			return False
+	elif not s.stop < pt <= start:
+		return False
+	return not (pt - start) % step
 
 
 def snormalize(slc: SliceRangeOptListT) -> SliceRangeOptListT:
@@ -170,9 +219,9 @@ def ssplit_1_(slc: SliceRangeT, splitPts: typing.Union[int, typing.Iterable[int]
 		splitPts = (splitPts,)
 	for p in splitPts:
 		if p != slc.start:
-			yield tp(slc.start, p, slc.step)
+			yield _mk(tp, slc.start, p, slc.step)
 		yield newMacroGroup
-		slc = tp(p, slc.stop, slc.step)
+		slc = _mk(tp, p, slc.stop, slc.step)
 	yield slc
 
 ssplit_1 = _createWrappedWithnewMacroGroup(ssplit_1_)
@@ -222,10 +271,73 @@ def schunks_(slc: SliceRangeT, chunkLen: int) -> SliceRangeSeqT:
 schunks = _createWrappedWithnewMacroGroup(schunks_)
 
 
+class SChunkRun(Sequence):
+	"""A run of `chunksCount` contiguous chunks of `chunkLen` points (in `step`s!!!) each, beginning at `start`, optionally followed by a shorter `tail` chunk. Takes O(1) memory instead of O(chunksCount): the chunks are created on access. `slen` and `sjoin_` process runs without expanding them, `soffset_split_`, `salign_` and the trees builders expand them lazily, use `sexpand_` to expand them explicitly."""
+
+	__slots__ = ("start", "chunkLen", "chunksCount", "step", "tail", "tp")
+
+	def __init__(self, start: int, chunkLen: int, chunksCount: int, step: typing.Optional[int] = 1, tail: int = 0, tp: SliceRangeTypeT = range) -> None:
+		if chunkLen <= 0 or chunksCount < 0 or not 0 <= tail < chunkLen:
+			raise ValueError("Invalid run", chunkLen, chunksCount, tail)
+		self.start = start
+		self.chunkLen = chunkLen
+		self.chunksCount = chunksCount
+		self.step = step
+		self.tail = tail
+		self.tp = tp
+
+	@classmethod
+	def fromChunks(cls, slc: SliceRangeT, chunkLen: int) -> "SChunkRun":
+		"""The same chunks as `schunks(slc, chunkLen)` gives, but as a run."""
+		chunksCount, tail = divmod(_slen(slc), chunkLen)
+		return cls(slc.start, chunkLen, chunksCount, slc.step, tail, slc.__class__)
+
+	@property
+	def pointsCount(self) -> int:
+		return self.chunkLen * self.chunksCount + self.tail
+
+	@property
+	def span(self) -> SliceRangeT:
+		"""The range/slice covering all the chunks, the same as the result of joining them."""
+		return _mk(self.tp, self.start, self.start + self.pointsCount * (1 if self.step is None else self.step), self.step)
+
+	def __len__(self) -> int:
+		return self.chunksCount + (self.tail > 0)
+
+	def __getitem__(self, i: typing.Union[int, slice]) -> typing.Union[SliceRangeT, typing.Tuple[SliceRangeT, ...]]:
+		if isinstance(i, slice):
+			return tuple(self[j] for j in range(*i.indices(len(self))))
+
+		n = len(self)
+		if i < 0:
+			i += n
+		if not 0 <= i < n:
+			raise IndexError(i)
+
+		step = 1 if self.step is None else self.step
+		b = self.start + i * self.chunkLen * step
+		l = self.chunkLen if i < self.chunksCount else self.tail
+		return _mk(self.tp, b, b + l * step, self.step)
+
+	def __repr__(self) -> str:
+		return self.__class__.__name__ + "(" + ", ".join(repr(getattr(self, k)) for k in self.__class__.__slots__) + ")"
+
+
+def sexpand_(slcs: typing.Iterable[typing.Union[SliceRangeT, SChunkRun]]) -> SliceRangeSeqT:
+	"""Replaces the `SChunkRun`s in a sequence with their chunks."""
+	for s in slcs:
+		if isinstance(s, SChunkRun):
+			yield from s
+		else:
+			yield s
+
+
 def soffset_split_(slc: typing.Iterable[SliceRangeT], splitPts: typing.Iterable[int]) -> SliceRangeSeqT:
 	"""Splits the slices by split points, which are OFFSETS FROM RANGE BEGINNING."""
 	if isinstance(slc, isInstArg):
 		slc = (slc,)
+	else:
+		slc = sexpand_(slc)
 	if isinstance(splitPts, int):
 		splitPts = (splitPts,)
 
@@ -261,8 +373,11 @@ soffset_split = _createWrappedWithnewMacroGroup(soffset_split_)
 
 
 def sjoin_(slcs: typing.Iterable[SliceRangeT]) -> SliceRangeSeqT:
-	"""Merges adjacent or overlapped ranges. All the ranges must be of the same direction. If the direction is negative, the sequence MUST be reversed! The sequence MUST be sorted. The type is taken from the type of the first range in the input."""
-	slcs = iter(slcs)
+	"""Merges adjacent or overlapped ranges. All the ranges must be of the same direction. If the direction is negative, the sequence MUST be reversed! The sequence MUST be sorted. The type is taken from the type of the first range in the input. `SChunkRun`s are replaced by their spans without expanding them."""
+	if isinstance(slcs, SChunkRun):
+		yield slcs.span
+		return
+	slcs = (s.span if isinstance(s, SChunkRun) else s for s in slcs)
 	try:
 		prevSlc = next(slcs)
 	except StopIteration:
@@ -276,7 +391,7 @@ def sjoin_(slcs: typing.Iterable[SliceRangeT]) -> SliceRangeSeqT:
 			#print("prevSlc.stop == s.start", prevSlc.stop == sPosDir.start)
 			#print("prevSlc.start == s.stop", prevSlc.start == sPosDir.stop)
 			if prevSlc.stop == s.start:
-				prevSlc = tp(prevSlc.start, s.stop, prevSlc.step)
+				prevSlc = _mk(tp, prevSlc.start, s.stop, prevSlc.step)
 			else:
 				yield prevSlc
 				prevSlc = s
@@ -286,6 +401,68 @@ def sjoin_(slcs: typing.Iterable[SliceRangeT]) -> SliceRangeSeqT:
 	yield prevSlc
 
 
+class Coalescer:
+	"""Incrementally merges overlapping and adjacent ranges coming in arbitrary order and direction. The ranges are buffered in a heap. Calling `advance` promises that no range starting before the watermark will be pushed anymore, so everything finished before it is emitted and dropped from the buffer. `None` and `1` steps are treated as the same step. Strided ranges are merged only with the ones of the same step and phase (`start % step`), a run is kept open for each of them, so interleaved phases don't break each other's runs. The results are positive-directed, their type is taken from the type of the first range pushed, the ones emitted by a single call are ordered by their starts."""
+
+	__slots__ = ("_heap", "_open", "_tp", "watermark")
+
+	def __init__(self) -> None:
+		self._heap = []
+		self._open = {}
+		self._tp = None
+		self.watermark = None
+
+	def push(self, slc: SliceRangeT) -> None:
+		if self._tp is None:
+			self._tp = slc.__class__
+		n = slice2range(snormalize(slc))
+		if not n:
+			return
+		if self.watermark is not None and n.start < self.watermark:
+			raise ValueError("The range " + repr(slc) + " starts before the watermark " + repr(self.watermark))
+		heapq.heappush(self._heap, (n.start, n.start + len(n) * n.step, n.step))
+
+	def advance(self, watermark: int) -> SliceRangeListT:
+		"""Moves the watermark and returns the ranges finished before it."""
+		res = []
+		heap = self._heap
+		runs = self._open
+		while heap and heap[0][0] < watermark:
+			start, stop, step = heapq.heappop(heap)
+			phase = (step, start % step)
+			cur = runs.get(phase)
+			if cur is not None:
+				if start <= cur[1]:
+					if stop > cur[1]:
+						cur[1] = stop
+					continue
+				res.append(cur)
+			runs[phase] = [start, stop, step]
+
+		for phase, cur in tuple(runs.items()):
+			if cur[1] < watermark:
+				res.append(cur)
+				del runs[phase]
+
+		self.watermark = watermark
+		res.sort()
+		return tuple(_mk(self._tp, *cur) for cur in res)
+
+	def flush(self) -> SliceRangeListT:
+		"""Emits everything buffered."""
+		res = self.advance(float("inf"))
+		self.watermark = None
+		return res
+
+
+def scoalesce_(slcs: typing.Iterable[SliceRangeT]) -> SliceRangeSeqT:
+	"""Merges overlapping and adjacent ranges. Unlike `sjoin_` the input needn't be sorted or of the same direction. See `Coalescer` for the details."""
+	c = Coalescer()
+	for s in slcs:
+		c.push(s)
+	yield from c.flush()
+
+
 def swithin(haystack: SliceRangeT, needle: SliceRangeT) -> bool:
 	"""Answers if needle is fully within haystack (including boundaries)."""
 	hsn = snormalize(haystack)
@@ -364,6 +541,7 @@ ssegments = _createWrappedWithnewMacroGroup(ssegments_)
 
 def salign_(sliceSequences: typing.Iterable[SliceRangeSeqT]) -> SliceRangeSeqT:
 	""""Aligns" seqs of ranges/slices OF THE SAME TOTAL LENGTH, returning ones with additional split points, so that all the sequences have segments of equal lengths between split points with the same indexes. See the test for more insight on what it does."""
+	sliceSequences = (ss if isinstance(ss, isInstArg) else sexpand_(ss) for ss in sliceSequences)
 	slcsPoints, slcsSplit = teeSliceSequences(sliceSequences, 2)
 
 	splitPoints = tuple(_deduplicatedIntegrator(*(map(_slen, ss) for ss in slcsPoints)))
@@ -1,10 +1,14 @@
 import typing
+import heapq
 import itertools
 from collections import defaultdict
+from html import escape
 
-from .utils import SliceRangeListT, SliceRangeT, sdir, slen, snormalize
+from .utils import SliceRangeListT, SliceRangeSeqT, SliceRangeT, sdir, slen, slice2range, snormalize
 from .diff import SDiffAutomata, sdiff
 
+__all__ = ("sviz", "svizScaled", "svizSVG_")
+
 
 def sviz(ranges: SliceRangeListT):
 	"""Draws ranges with ASCII art."""
@@ -109,3 +113,104 @@ def sviz(ranges: SliceRangeListT):
 	res = "\n".join(layers)
 	res += "\n" + rulerScale + "\n" + rulerImg
 	return res
+
+
+LaneItemT = typing.Tuple[int, int, int, bool, SliceRangeT]
+
+
+def _layoutLanes(ranges: SliceRangeSeqT, width: int, maxLanes: typing.Optional[int] = None) -> typing.Tuple[int, int, int, int, typing.List[LaneItemT]]:
+	"""Downsamples the coordinates into `width` buckets and assigns the ranges to lanes, so that the ranges sharing a bucket never share a lane. Greedy interval partitioning: the ranges are processed by their starts, each one takes the lowest lane freed before its first bucket. The lanes beyond `maxLanes` are merged into the last one. Returns `(origin, bucketSize, columns, lanesCount, items)`, where the items are `(firstColumn, lastColumn, lane, isNegative, range)`. Empty ranges are skipped."""
+	bounds = []
+	for s in ranges:
+		r = slice2range(s)
+		if r:
+			if r.step < 0:
+				bounds.append((r[-1], r[0] + 1, True, s))
+			else:
+				bounds.append((r[0], r[-1] + 1, False, s))
+
+	if not bounds:
+		return 0, 1, 0, 0, []
+
+	bounds.sort(key=lambda el: el[0])
+	origin = bounds[0][0]
+	span = max(el[1] for el in bounds) - origin
+	bucket = max(1, -(-span // width))
+	columns = (span - 1) // bucket + 1
+
+	busy = []
+	free = []
+	lanesCount = 0
+	items = []
+	for lo, hi, isNeg, s in bounds:
+		c0 = (lo - origin) // bucket
+		c1 = (hi - 1 - origin) // bucket
+		while busy and busy[0][0] < c0:
+			heapq.heappush(free, heapq.heappop(busy)[1])
+
+		if free:
+			lane = heapq.heappop(free)
+		else:
+			lane = lanesCount
+			lanesCount += 1
+
+		heapq.heappush(busy, (c1, lane))
+		items.append((c0, c1, lane, isNeg, s))
+
+	if maxLanes is not None and lanesCount > maxLanes:
+		lanesCount = maxLanes
+		items = [(c0, c1, min(lane, maxLanes - 1), isNeg, s) for c0, c1, lane, isNeg, s in items]
+
+	return origin, bucket, columns, lanesCount, items
+
+
+def _rulerTicks(origin: int, bucket: int, columns: int, tickEvery: int) -> typing.Iterator[typing.Tuple[int, int]]:
+	for c in range(0, columns, tickEvery):
+		yield c, origin + c * bucket
+
+
+def svizScaled(ranges: SliceRangeSeqT, width: int = 120, tickEvery: int = 10, maxLanes: typing.Optional[int] = None) -> str:
+	"""Draws ranges with ASCII art on a canvas of at most `width` columns, each column covers the same count of points. Overlapping ranges are put into different lanes, disjoint ones share them, so thousands of ranges can be drawn. `maxLanes` limits the height, the excess ranges are overdrawn in the last lane. O(n log n)."""
+	origin, bucket, columns, lanesCount, items = _layoutLanes(ranges, width, maxLanes)
+
+	lanes = [bytearray(b" ") * columns for _ in range(lanesCount)]
+	for c0, c1, lane, isNeg, _ in items:
+		buf = lanes[lane]
+		if c0 == c1:
+			buf[c0] = ord("<" if isNeg else ">")
+		else:
+			buf[c0:c1 + 1] = b"~" * (c1 - c0 + 1)
+			buf[c0] = ord("<" if isNeg else "[")
+			buf[c1] = ord("]" if isNeg else ">")
+
+	ruler = bytearray(b".") * columns
+	labels = bytearray(b" ") * columns
+	labelsEnd = 0
+	for c, x in _rulerTicks(origin, bucket, columns, tickEvery):
+		ruler[c] = ord("|")
+		lbl = str(x).encode("ascii")
+		if c >= labelsEnd and c + len(lbl) <= columns:
+			labels[c:c + len(lbl)] = lbl
+			labelsEnd = c + len(lbl) + 1
+
+	lines = [l.decode("ascii").rstrip() for l in lanes]
+	lines.append(ruler.decode("ascii"))
+	lines.append(labels.decode("ascii").rstrip())
+	return "\n".join(lines)
+
+
+def svizSVG_(ranges: SliceRangeSeqT, width: int = 1024, laneHeight: int = 10, tickEvery: int = 64, maxLanes: typing.Optional[int] = None) -> typing.Iterator[str]:
+	"""Draws ranges into an SVG image `width` pixels wide, with the same layout as `svizScaled`. Yields the markup in chunks, so it can be written into a file (or embedded into an HTML page) without building the whole document in memory. Every range has a tooltip with its repr."""
+	origin, bucket, columns, lanesCount, items = _layoutLanes(ranges, width, maxLanes)
+	rulerY = lanesCount * laneHeight + 2
+	height = rulerY + 16
+
+	yield '<svg xmlns="http://www.w3.org/2000/svg" width="' + str(max(columns, 1)) + '" height="' + str(height) + '" font-family="monospace" font-size="10">\n'
+	yield '<style>.p{fill:#4a90d9}.n{fill:#d9804a}</style>\n'
+	for c0, c1, lane, isNeg, s in items:
+		yield '<rect class="' + ("n" if isNeg else "p") + '" x="' + str(c0) + '" y="' + str(lane * laneHeight) + '" width="' + str(c1 - c0 + 1) + '" height="' + str(laneHeight - 1) + '"><title>' + escape(repr(s)) + "</title></rect>\n"
+
+	yield '<line x1="0" y1="' + str(rulerY) + '" x2="' + str(columns) + '" y2="' + str(rulerY) + '" stroke="black"/>\n'
+	for c, x in _rulerTicks(origin, bucket, columns, tickEvery):
+		yield '<line x1="' + str(c) + '" y1="' + str(rulerY) + '" x2="' + str(c) + '" y2="' + str(rulerY + 4) + '" stroke="black"/><text x="' + str(c) + '" y="' + str(rulerY + 14) + '">' + str(x) + "</text>\n"
+	yield "</svg>\n"
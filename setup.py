@@ -1,5 +1,24 @@
 #!/usr/bin/env python3
+import os
 from setuptools import setup
 
+COMPILED_MODULES = ("rangeslicetools/utils.py", "rangeslicetools/diff.py")
+
+
+def getExtModules():
+	"""The core modules are valid Cython in pure Python mode. They are compiled only if `RANGESLICETOOLS_COMPILE` env var is set and Cython is available, otherwise the package stays pure-Python. The compiled modules shadow the `.py` ones, so if they are missing the sources are imported."""
+	if not os.environ.get("RANGESLICETOOLS_COMPILE"):
+		return []
+
+	try:
+		from Cython.Build import cythonize
+		from Cython.Compiler import Options
+	except ImportError:
+		return []
+
+	Options.error_on_unknown_names = False  # some of the functions are generated by `_wrap` on import
+	return cythonize(COMPILED_MODULES, compiler_directives={"language_level": 3, "binding": True, "annotation_typing": False})
+
+
 if __name__ == "__main__":
-	setup(use_scm_version=True)
+	setup(use_scm_version=True, ext_modules=getExtModules())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Measures the hot core functions on the inputs of the unit tests. Run it against a pure-Python install and against one built with `RANGESLICETOOLS_COMPILE=1` to see the speedup of the compiled modules."""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+import rangeslicetools
+from rangeslicetools import sdiff, slen, sPointIn, snormalize, sjoin, salign
+from rangeslicetools.utils import _getStepForComputation, isInstArg
+
+diffPairs = (
+	((0, 5, 1), (5, 10, 1)),
+	((0, 7, 1), (5, 10, 1)),
+	((0, 10, 1), (5, 7, 1)),
+	((15, 7, -1), (15, -1, -1)),
+	((7, -1, -1), (2, 1, -1)),
+	((0, 5, 1), (9, 4, -1)),
+	((4, -1, -1), (5, 10, 1)),
+	((0, 7, 1), (9, 4, -1)),
+	((6, -1, -1), (5, 10, 1)),
+	((0, 10, 1), (6, 4, -1)),
+	((9, -1, -1), (5, 7, 1)),
+)
+singles = ((0, 16, 1), (17, -1, -2), (15, -1, -1), (0, 16), (14, -2, -2))
+joinable = ((0, 8, 1), (8, 9, 1), (10, 12, 1), (12, 14, 1))
+alignable = (((9, 8, -1), (8, 7, -1), (7, -1, -1)), ((19, 15, -1), (15, 13, -1), (13, 9, -1)))
+
+
+def prepare(ctor):
+	return {
+		"diffPairs": tuple((ctor(*a), ctor(*b)) for a, b in diffPairs),
+		"singles": tuple(ctor(*el) for el in singles),
+		"joinable": tuple(ctor(*el) for el in joinable),
+		"alignable": tuple(tuple(ctor(*el) for el in seq) for seq in alignable),
+	}
+
+
+def benchDiff(inputs):
+	for a, b in inputs["diffPairs"]:
+		sdiff(a, b)
+
+
+def benchSingles(inputs):
+	for s in inputs["singles"]:
+		_getStepForComputation(s)
+		slen(s)
+		sPointIn(s, 3)
+		snormalize(s)
+
+
+def benchJoinAlign(inputs):
+	sjoin(inputs["joinable"])
+	salign(inputs["alignable"])
+
+
+def main():
+	number = 2000
+	print("compiled:", rangeslicetools.compiled)
+	for ctor in isInstArg:
+		inputs = prepare(ctor)
+		for f in (benchDiff, benchSingles, benchJoinAlign):
+			t = min(timeit.repeat(lambda: f(inputs), number=number, repeat=5))
+			print("{:>8} {:<16} {:10.2f} us/iter".format(ctor.__name__, f.__name__, t / number * 1e6))
+
+
+if __name__ == "__main__":
+	main()
@@ -2,7 +2,9 @@
 import typing
 import os, sys
 import unittest
+import asyncio
 import itertools
+import bisect
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
@@ -11,6 +13,19 @@ sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
 #dict = OrderedDict
 
 from rangeslicetools import *
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+try:
+	import pandas
+except ImportError:
+	pandas = None
+try:
+	import pyarrow
+except ImportError:
+	pyarrow = None
 from rangeslicetools.utils import _getStepForComputation, isInstArg
 
 
@@ -107,6 +122,11 @@ class Tests(unittest.TestCase):
 			((15, -1, -1), 18): False,
 			((15, -1, -1), 16): False,
 			((15, -1, -1), 0): True,
+
+			((0, 16, 2), 3): False,
+			((0, 16, 2), 14): True,
+			((17, -1, -2), 3): True,
+			((17, -1, -2), 4): False,
 		}
 
 		for ctor in isInstArg:
@@ -369,6 +389,90 @@ class SplitMergeTests(unittest.TestCase):
 				with self.subTest(initialRanges=initialRanges):
 					self.assertEqual(sjoin(initialRanges), expectedResult)
 
+	def test_SChunkRun(self) -> None:
+		for src, chunkLen in ((range(0, 103), 10), (range(0, 100), 10), (slice(15, -1, -1), 4), (range(40, 0, -3), 3)):
+			run = SChunkRun.fromChunks(src, chunkLen)
+			chunks = schunks(src, chunkLen)
+			with self.subTest(src=src, chunkLen=chunkLen):
+				self.assertEqual(tuple(run), chunks)
+				self.assertEqual(len(run), len(chunks))
+				self.assertEqual(run[-1], chunks[-1])
+				self.assertEqual(run[1:3], chunks[1:3])
+				self.assertEqual(slen(run), slen(src))
+				self.assertEqual(sjoin(run), sjoin(chunks))
+
+		run = SChunkRun(0, 4, 25)
+		self.assertEqual(run.chunksCount, 25)
+		self.assertEqual(run.count(range(8, 12)), 1)
+		self.assertEqual(run.index(range(8, 12)), 2)
+		mixed = [range(-8, 0), run, range(100, 103)]
+		expanded = sexpand(mixed)
+		self.assertEqual(len(expanded), 27)
+		self.assertEqual(slen(mixed), 111)
+		self.assertEqual(sjoin(mixed), (range(-8, 103),))
+		self.assertEqual(soffset_split(mixed, [3, 50]), soffset_split(expanded, [3, 50]))
+		self.assertEqual(salign((run, (range(500, 600),))), salign((tuple(run), (range(500, 600),))))
+
+		self.assertEqual(tuple(RangesTree.build(index=run).keys()), tuple(run))
+		self.assertEqual(tuple(RangesTree.build(index=iter(mixed)).keys()), expanded)
+		self.assertEqual(tuple(RangesTree.build(index=mixed, data=range(1000, 1111)).values()), tuple(range(1000 + el.start + 8, 1000 + el.stop + 8) for el in expanded))
+
+	def test_interning(self) -> None:
+		r = range(0, 16, 1)
+		self.assertIs(slice2range(r), r)
+		self.assertIsNot(srev(r), srev(r))
+
+		index = tuple(range(i, i + 4) for i in range(0, 64, 4))
+		pool = enableInterning(maxSize=256)
+		try:
+			self.assertIs(getInterning(), pool)
+			self.assertIs(srev(r), srev(r))
+			self.assertIs(range2slice(r), range2slice(range(0, 16)))
+			self.assertEqual(schunks(r, 4), tuple(range(i, i + 4) for i in range(0, 16, 4)))
+			self.assertIs(schunks(r, 4)[3], ssplit(r, 12)[1])
+
+			t1 = RangesTree.build(index=index)
+			t2 = RangesTree.build(index=index)
+			self.assertIs(t1.index, t2.index)
+			self.assertIs(t1.left.index, t2.left.index)
+			self.assertGreater(pool.stats()["hits"], 0)
+		finally:
+			disableInterning()
+		self.assertIsNone(getInterning())
+		self.assertIsNot(srev(r), srev(r))
+
+	def test_scoalesce(self) -> None:
+		pairs = {
+			((9, 10, 1), (0, 8, 1), (8, 9, 1)): ((0, 10, 1),),
+			((4, 12), (0, 6, 1), (20, 25), (14, 11, -1)): ((0, 15, 1), (20, 25, 1)),
+			((0, 8, 2), (11, 15, 2), (8, 10, 2), (4, 7, 2)): ((0, 10, 2), (11, 15, 2)),
+			((0, 4), (4, 8, 2)): ((0, 4, 1), (4, 8, 2)),
+			((0, 10, 2), (1, 5, 2), (4, 6, 2)): ((0, 10, 2), (1, 5, 2)),
+			((1, 3, 2), (0, 4, 2), (3, 7, 2), (4, 10, 2), (7, 10, 3)): ((0, 10, 2), (1, 7, 2), (7, 10, 3)),
+			(): (),
+		}
+
+		for ctor in isInstArg:
+			for initialRanges, expectedResult in pairs.items():
+				initialRanges = cnss(ctor, initialRanges)
+				expectedResult = cnss(ctor, expectedResult)
+
+				with self.subTest(initialRanges=initialRanges):
+					self.assertEqual(scoalesce(initialRanges), expectedResult)
+
+	def test_Coalescer(self) -> None:
+		c = Coalescer()
+		c.push(range(10, 12))
+		c.push(range(0, 4))
+		c.push(range(3, 6))
+		self.assertEqual(c.advance(6), ())
+		self.assertEqual(c.advance(7), (range(0, 6, 1),))
+		c.push(range(7, 10))
+		self.assertEqual(c.advance(10), ())
+		with self.assertRaises(ValueError):
+			c.push(range(5, 8))
+		self.assertEqual(c.flush(), (range(7, 12, 1),))
+
 	def test_salign(self) -> None:
 		testMatrix = {
 			(
@@ -628,6 +732,280 @@ class DiffTests(unittest.TestCase):
 						resp
 					)
 
+	def test_sjoin_overlaps(self) -> None:
+		import random
+
+		rnd = random.Random(7)
+
+		def genRanges(count):
+			res = []
+			for _ in range(count):
+				lo = rnd.randint(0, 200)
+				hi = lo + rnd.randint(1, 20)
+				if rnd.random() < 0.3:
+					res.append(range(hi - 1, lo - 1, -1))
+				else:
+					res.append(range(lo, hi, 1))
+			return sorted(res, key=lambda r: snormalize(r).start)
+
+		for tolerance in (0, 1, 3):
+			for sameDirection in (False, True):
+				a = genRanges(60)
+				b = genRanges(40)
+				expected = set()
+				for i, ra in enumerate(a):
+					for j, rb in enumerate(b):
+						na, nb = snormalize(ra), snormalize(rb)
+						lo, hi = max(na.start, nb.start), min(na.stop, nb.stop)
+						if hi - lo <= -tolerance or (sameDirection and sdir(ra) != sdir(rb)):
+							continue
+						expected.add((i, j, sdirect(ra, range(lo, hi, 1)) if lo < hi else None))
+
+				with self.subTest(tolerance=tolerance, sameDirection=sameDirection):
+					res = list(sjoin_overlaps_(iter(a), iter(b), tolerance, sameDirection))
+					self.assertEqual(len(res), len(expected))
+					self.assertEqual(set(res), expected)
+
+	def test_sjoin_overlaps_sparse(self) -> None:
+		pulled = []
+
+		def denseStream():
+			for i in range(5000):
+				pulled.append(i)
+				yield range(i * 10, i * 10 + 5)
+
+		pairs = sjoin_overlaps_(denseStream(), iter((range(3, 8),)))
+		self.assertEqual(next(pairs), (0, 0, range(3, 5)))
+		self.assertLess(len(pulled), 5)
+		self.assertEqual(tuple(pairs), ())
+		self.assertEqual(len(pulled), 5000)
+
+		pulled.clear()
+		self.assertEqual(tuple(sjoin_overlaps_(denseStream(), iter((range(49993, 49998),)))), ((4999, 0, range(49993, 49995)),))
+		self.assertEqual(tuple(sjoin_overlaps_(denseStream(), iter((range(25002, 25009),)), tolerance=2)), ((2500, 0, range(25002, 25005)), (2501, 0, None)))
+
+	def test_sdelta(self) -> None:
+		old = (range(0, 10), range(20, 30), range(40, 45), range(50, 60))
+		new = (range(5, 15), range(20, 25), range(25, 30), range(44, 39, -1), range(70, 75))
+		self.assertEqual(list(sdelta_(old, new)), [
+			(DELTA_REMOVED, range(0, 5)),
+			(DELTA_UNCHANGED, range(5, 10)),
+			(DELTA_ADDED, range(10, 15)),
+			(DELTA_UNCHANGED, range(20, 30)),
+			(DELTA_UNCHANGED, range(40, 45)),
+			(DELTA_REMOVED, range(50, 60)),
+			(DELTA_ADDED, range(70, 75)),
+		])
+		added, removed, unchanged = sdelta(old, new)
+		self.assertEqual(added, (range(10, 15), range(70, 75)))
+		self.assertEqual(removed, (range(0, 5), range(50, 60)))
+		self.assertEqual(unchanged, (range(5, 10), range(20, 30), range(40, 45)))
+		self.assertEqual(sdelta((), ()), ((), (), ()))
+		self.assertEqual(list(sdelta_([range(5, 5), range(10, 20)], [range(5, 15), range(30, 28)])), [(DELTA_ADDED, range(5, 10)), (DELTA_UNCHANGED, range(10, 15)), (DELTA_REMOVED, range(15, 20))])
+		self.assertEqual(sdelta([slice(0, 4)], [slice(2, 6)]), ((slice(4, 6, 1),), (slice(0, 2, 1),), (slice(2, 4, 1),)))
+
+	def test_strided(self) -> None:
+		import random
+
+		rnd = random.Random(44)
+		for _ in range(1000):
+			rs = []
+			for _ in range(2):
+				step = rnd.choice((1, 2, 3, 4, 6, 7, 12))
+				start = rnd.randint(-50, 50)
+				stop = start + rnd.randint(0, 120)
+				if rnd.random() < 0.3:
+					rs.append(range(stop, start, -step))
+				else:
+					rs.append(range(start, stop, step))
+			r1, r2 = rs
+			p1, p2 = set(r1), set(r2)
+			with self.subTest(r1=r1, r2=r2):
+				i = sintersect(r1, r2)
+				self.assertEqual(set(i) if i is not None else set(), p1 & p2)
+				if i is not None and len(i) > 1:
+					self.assertEqual(sdir(i), sdir(r1))
+				self.assertEqual(sintersects(r1, r2), bool(p1 & p2))
+
+				pieces = ssubStrided(r1, r2)
+				self.assertEqual(sum(len(el) for el in pieces), len(p1 - p2))
+				self.assertEqual(set(itertools.chain.from_iterable(pieces)), p1 - p2)
+				for el in pieces:
+					if len(el) > 1:
+						self.assertEqual(sdir(el), sdir(r1))
+
+		self.assertEqual(sintersect(range(0, 10 ** 18, 4), range(6, 10 ** 18, 6)), range(12, 10 ** 18, 12))
+		self.assertIsNone(sintersect(range(0, 10 ** 18, 4), range(3, 10 ** 18, 6)))
+		self.assertEqual(sintersect(slice(0, 100, 4), slice(6, 100, 6)), slice(12, 97, 12))
+		self.assertEqual(ssubStrided(range(0, 24, 2), range(0, 24, 6)), (range(2, 18, 6), range(4, 18, 6), range(20, 24, 2)))
+
+	def test_scoverage(self) -> None:
+		import random
+
+		rnd = random.Random(49)
+		ranges = []
+		for _ in range(300):
+			lo = rnd.randint(0, 500)
+			hi = lo + rnd.randint(0, 40)
+			step = rnd.choice((1, 1, 2, 3, 5))
+			ranges.append(range(hi - 1, lo - 1, -step) if rnd.random() < 0.3 else range(lo, hi, step))
+
+		counts = [0] * 600
+		for r in ranges:
+			if r:
+				for p in range(min(r), max(r) + 1):
+					counts[p] += 1
+
+		breakpoints, depths = scoverage(ranges)
+		self.assertEqual(len(breakpoints), len(depths) + 1)
+		for p in range(600):
+			i = bisect.bisect_right(breakpoints, p) - 1
+			expected = counts[p]
+			with self.subTest(p=p):
+				self.assertEqual(depths[i] if 0 <= i < len(depths) else 0, expected)
+
+		for k in (1, 3, 7):
+			with self.subTest(k=k):
+				self.assertEqual(tuple(itertools.chain.from_iterable(scovered(ranges, k))), tuple(p for p in range(600) if counts[p] >= k))
+
+		self.assertEqual(scoverage(()), ((), ()))
+		self.assertEqual(scoverage((range(0, 4), range(2, 6), range(8, 10))), ((0, 2, 4, 6, 8, 10), (1, 2, 1, 0, 1)))
+
+		if numpy is not None:
+			rows = numpy.array([(r.start, r.stop, r.step) for r in ranges])
+			npBreakpoints, npDepths = scoverage(rows)
+			self.assertEqual(tuple(npBreakpoints.tolist()), breakpoints)
+			self.assertEqual(tuple(npDepths.tolist()), depths)
+			self.assertEqual(scovered(rows, 3), scovered(ranges, 3))
+			strided = (range(0, 11, 3), range(17, 10, -3), range(5, 5, 2), range(20, 22, 7))
+			npBreakpoints, npDepths = scoverage(numpy.array([(r.start, r.stop, r.step) for r in strided]))
+			self.assertEqual((tuple(npBreakpoints.tolist()), tuple(npDepths.tolist())), scoverage(strided))
+			self.assertEqual(scoverage(strided), ((0, 10, 11, 18, 20, 21), (1, 0, 1, 0, 1)))
+			t = RangesTree.build(index=numpy.column_stack((npBreakpoints[:-1], npBreakpoints[1:])), data=None)
+			self.assertEqual(len(t), len(npDepths))
+
+	def test_memoization(self) -> None:
+		import threading
+		import rangeslicetools.diff
+
+		pairs = (
+			(range(0, 7, 1), range(5, 10, 1)),
+			(slice(0, 7), slice(5, 10)),
+			(range(9, 4, -1), range(0, 5, 1)),
+		)
+		expected = [(sdiff(*p), sgap(*p), sdist(*p), ssub(*p)) for p in pairs]
+
+		memo = rangeslicetools.diff.enableMemoization(maxSize=16)
+		try:
+			def worker(results):
+				for _ in range(10):
+					results.append([(sdiff(*p), sgap(*p), sdist(*p), ssub(*p)) for p in pairs])
+
+			results = []
+			threads = [threading.Thread(target=worker, args=(results,)) for _ in range(4)]
+			for t in threads:
+				t.start()
+			for t in threads:
+				t.join()
+
+			for r in results:
+				self.assertEqual(r, expected)
+
+			st = memo.stats()
+			self.assertEqual(st["size"], 12)
+			self.assertGreater(st["hits"], st["misses"])
+
+			memo.clear()
+			self.assertEqual(memo.stats()["hits"], 0)
+			self.assertEqual(len(memo), 0)
+		finally:
+			rangeslicetools.diff.disableMemoization()
+		self.assertIsNone(rangeslicetools.diff.getMemoization())
+
+
+class OffsetIndexTests(unittest.TestCase):
+	def testOffsetIndex(self) -> None:
+		src = ((7, -1, -1), (10, 10, 1), (15, 7, -1), (20, 24, 1))
+		locations = {
+			0: (0, 7),
+			5: (0, 2),
+			7: (0, 0),
+			8: (2, 15),
+			15: (2, 8),
+			16: (3, 20),
+			19: (3, 23),
+		}
+		slices = {
+			(0, 8): ((7, -1, -1),),
+			(6, 10): ((1, -1, -1), (15, 13, -1)),
+			(14, 18): ((9, 7, -1), (20, 22, 1)),
+			(-5, 100): ((7, -1, -1), (15, 7, -1), (20, 24, 1)),
+			(5, 5): (),
+		}
+		for ctor in isInstArg:
+			idx = OffsetIndex(cnss(ctor, src))
+			self.assertEqual(len(idx), 20)
+			for offset, expected in locations.items():
+				with self.subTest(ctor=ctor, offset=offset):
+					self.assertEqual(idx.locate(offset), expected)
+
+			self.assertEqual(idx.locate_many(locations.keys()), list(locations.values()))
+
+			for bounds, expected in slices.items():
+				with self.subTest(ctor=ctor, bounds=bounds):
+					self.assertEqual(idx.slice_logical(*bounds), cnss(ctor, expected))
+
+			with self.assertRaises(IndexError):
+				idx.locate(20)
+
+
+class GapIndexTests(unittest.TestCase):
+	def testGapIndex(self) -> None:
+		import random
+
+		def bruteFit(gaps, length, pos, best=False):
+			candidates = []
+			for g in gaps:
+				gs = max(g.start, pos)
+				if g.stop - gs >= length:
+					candidates.append((g.stop - g.start if best else 0, gs))
+			if not candidates:
+				return None
+			gs = min(candidates)[1]
+			return range(gs, gs + length)
+
+		rnd = random.Random(42)
+		idx = GapIndex(range(0, 256), (range(10, 20), range(100, 101)), seed=1)
+		self.assertEqual(tuple(idx), (range(10, 20), range(100, 101)))
+		self.assertEqual(tuple(idx.gaps()), (range(0, 10), range(20, 100), range(101, 256)))
+		with self.assertRaises(ValueError):
+			idx.reserve(range(15, 25))
+
+		allocated = []
+		for i in range(500):
+			with self.subTest(i=i):
+				gaps = tuple(idx.gaps())
+				length = rnd.randint(1, 12)
+				self.assertEqual(idx.first_fit(length), bruteFit(gaps, length, 0))
+				self.assertEqual(idx.best_fit(length), bruteFit(gaps, length, 0, True))
+				self.assertEqual(idx.next_fit(length), bruteFit(gaps, length, idx.cursor) or bruteFit(gaps, length, 0))
+
+				if allocated and rnd.random() < 0.45:
+					victim = allocated.pop(rnd.randrange(len(allocated)))
+					idx.free(victim)
+				else:
+					res = idx.allocate(length, rnd.choice(("first", "best", "next")))
+					if res is not None:
+						allocated.append(res)
+
+		self.assertEqual(sum(len(g) for g in idx.gaps()) + sum(len(a) for a in idx), 256)
+
+		idx = GapIndex(range(0, 10), (range(0, 10),))
+		idx.free(range(3, 5))
+		self.assertEqual(tuple(idx), (range(0, 3), range(5, 10)))
+		with self.assertRaises(ValueError):
+			idx.free(range(2, 6))
+
 
 class IndexTestsProto(unittest.TestCase):
 	indexerCtor = None
@@ -871,6 +1249,219 @@ class TreeTests(IndexTestsProto):
 				
 				self.assertEqual((tuple(el.index for el in t), tuple(el.indexee for el in t)), etalonFlatStructure)
 
+	def testsBulkLoad(self):
+		for count in (1, 2, 3, 5, 8, 13, 100):
+			index = tuple(range(i * 2, i * 2 + 2) for i in range(count))
+			data = tuple(range(-i * 2, -i * 2 - 2, -1) for i in range(count))
+			with self.subTest(count=count):
+				t = RangesTree.build(index=index, data=data)
+				self.assertEqual(repr(RangesTree.build(index=iter(index), data=iter(data))), repr(t))
+				self.assertEqual(len(t), count)
+				self.assertEqual(tuple(el.index for el in t), index)
+				self.assertEqual(tuple(el.indexee for el in t), data)
+				if count > 1:
+					self.assertEqual(t.index, range(0, count * 2))
+				self.assertEqual(repr(RangesTree.build(index=index, data=())), repr(RangesTree.build(index=index)))
+
+		with self.assertRaises(ValueError):
+			RangesTree.build(index=())
+
+	@unittest.skipUnless(numpy, "NumPy is not installed")
+	def testsBulkLoadNumPy(self):
+		arr = numpy.array([(i * 2, i * 2 + 2) for i in range(10)])
+		t = RangesTree.build(index=arr)
+		self.assertEqual(tuple(el.index for el in t), tuple(range(i * 2, i * 2 + 2) for i in range(10)))
+
+	def testsAggregated(self):
+		class MaxPartTree(AggregatedRangesTree):
+			__slots__ = ()
+			IDENTITY = 0
+
+			@staticmethod
+			def leafValue(leaf, part):
+				return len(part)
+
+			combine = staticmethod(max)
+
+		index = ((0, 3, 1), (6, 7, 1), (12, 16, 1), (16, 20, 1), (30, 40, 2), (41, 50, 1))
+		queries = ((-5, 0, 1), (0, 100, 1), (1, 13, 1), (2, 7, 1), (13, 35, 1), (31, 42, 1), (19, 11, -1), (8, 10, 1), (31, 32, 1))
+
+		for ctor in isInstArg:
+			t = MaxPartTree.build(index=cnss(ctor, index))
+			for q in queries:
+				q = ctor(*q)
+				with self.subTest(q=q):
+					parts = [set(slice2range(el.index)) & set(slice2range(q)) for el in t[q]]
+					self.assertEqual(t.count_overlapping(q), len(parts))
+					self.assertEqual(t.covered_length(q), sum(len(p) for p in parts))
+					self.assertEqual(t.reduce(q), max((len(p) for p in parts), default=0))
+
+			t[ctor(60, 70, 1)] = ctor(60, 70, 1)
+			self.assertEqual(t.count, 7)
+			self.assertEqual(t.covered_length(ctor(0, 100, 1)), 36)
+			self.assertEqual(t.reduce(ctor(0, 100, 1)), 10)
+
+	def testsAggregatedSetItem(self):
+		class StartsSumTree(AggregatedRangesTree):
+			__slots__ = ()
+			IDENTITY = 0
+
+			@staticmethod
+			def leafValue(leaf, part):
+				return leaf.indexee.start
+
+			@staticmethod
+			def combine(a, b):
+				return a + b
+
+		index = tuple(range(i, i + 4) for i in range(0, 32, 4))
+		t = StartsSumTree.build(index=index, data=tuple(range(i.start + 100, i.stop + 100) for i in index))
+		self.assertEqual(t.value, 912)
+		t[range(8, 12)] = range(900, 904)
+		self.assertEqual(t.value, 1704)
+		self.assertEqual(t.reduce(range(0, 32)), 1704)
+
+		t = StartsSumTree.build(index=index)
+		self.assertEqual(t.value, 112)
+		t[range(8, 12)] = range(500, 504)
+		self.assertEqual(t.value, 604)
+		self.assertEqual(t.reduce(range(0, 32)), 604)
+
+		t[range(40, 44)] = range(40, 44)
+		self.assertEqual(t.value, 644)
+		self.assertEqual(t.count, 9)
+
+	def testsSetPersistent(self):
+		setElProto = (18, 22, 1)
+		treeProto = ((0, 4, 1), (4, 8, 1), (8, 12, 1), (12, 16, 1))
+		matrix = {
+			(-12, -8, 1): ((0, 4, 1), setElProto, (8, 12, 1), (12, 16, 1)),
+			(16, 20, 1): ((0, 4, 1), (4, 8, 1), (8, 12, 1), (12, 16, 1), setElProto),
+		}
+
+		for ctor in isInstArg:
+			src = cnss(ctor, treeProto)
+			setEl = ctor(*setElProto)
+			for index2Set, etalonData in matrix.items():
+				t = RangesTree.build(index=ctor(-16, 0, 1), data=src)
+				h = SnapshotRangesTree(t)
+				snap = h.snapshot
+				index2Set = ctor(*index2Set)
+				h[index2Set] = setEl
+				with self.subTest(index2Set=index2Set):
+					self.assertIs(snap, t)
+					self.assertEqual(tuple(el.indexee for el in snap), src)
+					self.assertEqual(tuple(el.indexee for el in h.snapshot), cnss(ctor, etalonData))
+					self.assertTrue(h.snapshot.left is t.left or h.snapshot.right is t.right)
+
+	def testsAsync(self):
+		index = tuple(range(i, i + 4) for i in range(0, 64, 4))
+		data = tuple(range(i, i + 4) for i in range(-64, 0, 4))
+		queries = (range(0, 8), range(5, 37), range(63, 64), range(-5, 0), range(0, 64))
+
+		async def collect(t, q):
+			return tuple([el async for el in t.aget(q, yieldEvery=2)])
+
+		loop = asyncio.new_event_loop()
+		try:
+			t = RangesTree.build(index=index, data=data)
+			at = loop.run_until_complete(RangesTree.abuild(index=index, data=data, yieldEvery=3))
+			self.assertEqual(tuple(t), tuple(at))
+
+			for q in queries:
+				with self.subTest(q=q):
+					self.assertEqual(loop.run_until_complete(collect(at, q)), tuple(t[q]))
+		finally:
+			loop.close()
+
+	def testsCursor(self):
+		indexes = (
+			(range(0, 4), range(4, 9), range(12, 16), range(16, 30, 2), range(40, 41)),
+			(range(40, 35, -1), range(35, 20, -1), range(17, 10, -3), range(8, -1, -1)),
+			(range(3, 7),),
+		)
+		for index in indexes:
+			t = RangesTree.build(index=index)
+			isNeg = index[0].stop < index[0].start
+			with self.subTest(index=index):
+				c = t.cursor()
+				self.assertEqual(tuple(el.index for el in c), index)
+				self.assertIsNone(c.current)
+				self.assertIsNone(c.next())
+				self.assertEqual(c.prev().index, index[-1])
+				for i in reversed(range(len(index) - 1)):
+					self.assertEqual(c.prev().index, index[i])
+				self.assertIsNone(c.prev())
+				self.assertEqual(c.next().index, index[0])
+
+				for pos in range(-3, 45):
+					expected = next((el for el in index if (el.stop < pos if isNeg else el.stop > pos)), None)
+					leaf = c.seek(pos)
+					self.assertEqual(leaf.index if leaf else None, expected)
+					self.assertEqual(tuple(el.index for el in t.cursor(pos)), index[index.index(expected):] if expected else ())
+
+	def testsMerge(self):
+		a = tuple(range(i, i + 4) for i in range(0, 64, 8))
+		b = tuple(range(i, i + 4) for i in range(4, 64, 16))
+		ta = RangesTree.build(index=a, data=tuple(range(i + 100, i + 104) for i in range(0, 64, 8)))
+		tb = RangesTree.build(index=b)
+		merged = RangesTree.merge(ta, tb)
+		self.assertEqual(tuple(merged.keys()), tuple(sorted(a + b, key=lambda r: r.start)))
+		self.assertEqual(tuple(merged[range(8, 13)]), (ValueLeaf(range(8, 12), range(108, 112)),))
+		self.assertIsNot(next(iter(merged)), next(iter(ta)))
+
+		self.assertEqual(tuple(RangesTree.merge(ta, ta).items()), tuple(ta.items()))
+
+		c = RangesTree.build(index=(range(2, 6), range(30, 34)))
+		with self.assertRaises(ValueError):
+			RangesTree.merge(ta, c)
+
+		def preferLater(prev, leaf):
+			res = [leaf]
+			for part in ssub(prev.index, leaf.index):
+				if part.start < leaf.index.start:
+					res.insert(0, ValueLeaf(part, part))
+				else:
+					res.append(ValueLeaf(part, part))
+			return res
+
+		self.assertEqual(tuple(RangesTree.merge(ta, c, resolve=preferLater).keys()), (range(0, 2), range(2, 6), range(8, 12), range(16, 20), range(24, 28), range(30, 32), range(32, 36), range(40, 44), range(48, 52), range(56, 60)))
+		self.assertEqual(tuple(RangesTree.merge(ta, c, resolve=lambda prev, leaf: ()).keys()), a[1:4] + a[5:])
+		with self.assertRaisesRegex(ValueError, "merge is empty"):
+			RangesTree.merge(RangesTree.build(index=(range(0, 4),)), RangesTree.build(index=(range(2, 10),)), resolve=lambda prev, leaf: ())
+
+		na = RangesTree.build(index=tuple(srev(el) for el in reversed(a)))
+		nb = RangesTree.build(index=tuple(srev(el) for el in reversed(b)))
+		self.assertEqual(tuple(RangesTree.merge(na, nb).keys()), tuple(srev(el) for el in sorted(a + b, key=lambda r: -r.start)))
+		with self.assertRaises(ValueError):
+			RangesTree.merge(ta, nb)
+		with self.assertRaises(ValueError):
+			RangesTree.merge(RangesTree.build(index=(range(10, 0, -1),)), RangesTree.build(index=(range(20, 30), range(40, 50))))
+		with self.assertRaises(ValueError):
+			RangesTree.merge(RangesTree.build(index=(range(20, 30),)), RangesTree.build(index=(range(10, 0, -1),)))
+		self.assertEqual(tuple(RangesTree.merge(RangesTree.build(index=(range(60, 55, -1),)), nb).keys())[:2], (range(60, 55, -1), srev(b[-1])))
+
+	def testsStab(self):
+		indexes = (
+			(range(0, 4), range(4, 9), range(12, 16), range(16, 30, 2), range(40, 41)),
+			(range(40, 35, -1), range(35, 20, -1), range(17, 10, -3), range(8, -1, -1)),
+		)
+		for index in indexes:
+			t = RangesTree.build(index=index)
+			points = tuple(range(-3, 45))
+			expected = [next((i for i, r in enumerate(index) if p in r), None) for p in points]
+			with self.subTest(index=index):
+				for p, e in zip(points, expected):
+					self.assertEqual(tuple(el.index for el in t[p]), () if e is None else (index[e],))
+				self.assertEqual(t.stab_many(reversed(points)), expected[::-1])
+				if numpy is not None:
+					self.assertEqual(t.stab_many(numpy.array(points)).tolist(), [-1 if e is None else e for e in expected])
+
+		leaf = RangesTree.build(index=(range(0, 8, 2),))
+		self.assertEqual(tuple(leaf[2]), (leaf,))
+		self.assertEqual(tuple(leaf[3]), ())
+		self.assertEqual(tuple(leaf[range(3, 4)]), (leaf,))
+
 
 #@unittest.skip
 class SeqTests(IndexTestsProto):
@@ -927,6 +1518,188 @@ class SeqTests(IndexTestsProto):
 		}
 		self._testIndex(index, matrix, src)
 
+	def testQueryCache(self) -> None:
+		index = tuple(range(i, i + 4) for i in range(0, 32, 4))
+		data = tuple(range(i, i + 4) for i in range(100, 132, 4))
+		queries = (range(1, 6), range(5, 1, -1), range(13, 20), range(25, 30), slice(1, 6))
+
+		seq = SliceSequence(index=index, data=data)
+		expected = [tuple(seq[q]) for q in queries]
+		cache = seq.enableQueryCache(maxSize=16)
+		tree = seq.tree
+		seq.tree = CachedRangesTree(tree, maxSize=16)
+		treeCache = seq.tree.queryCache
+		self.assertIs(seq.queryCache, cache)
+		for _ in range(3):
+			for q, e in zip(queries, expected):
+				with self.subTest(q=q):
+					self.assertEqual(tuple(seq[q]), e)
+					self.assertEqual(tuple(seq.tree[q]), tuple(el.node for el in tree.getPath(q)))
+		self.assertEqual(cache.stats()["hits"], 10)
+		self.assertEqual(cache.stats()["misses"], 5)
+		self.assertEqual(len(cache), 5)
+
+		seq[range(12, 16)] = range(200, 204)
+		self.assertEqual(len(cache), 4)
+		self.assertEqual(len(treeCache), 4)
+		self.assertEqual(tuple(seq[range(13, 20)]), (ValueLeaf(range(13, 16), range(201, 204)), ValueLeaf(range(16, 20), range(116, 120))))
+		self.assertEqual(tuple(seq[range(1, 6)]), expected[0])
+
+		seq.disableQueryCache()
+		seq.tree = tree
+		self.assertIsNone(seq.queryCache)
+		self.assertEqual(tuple(seq[range(13, 20)]), (ValueLeaf(range(13, 16), range(201, 204)), ValueLeaf(range(16, 20), range(116, 120))))
+
+	def testSequenceComposeInvert(self) -> None:
+		def lookupPoint(seq, p):
+			for idx, val in seq.pairs():
+				idx = slice2range(idx)
+				if p in idx:
+					return slice2range(val)[idx.index(p)]
+			return None
+
+		first = SliceSequence(index=range(0, 16, 1), data=(range(7, -1, -1), range(15, 7, -1)))
+		second = SliceSequence(index=(range(0, 5, 1), range(5, 12, 1), range(12, 20, 1)), data=(range(100, 105, 1), range(211, 204, -1), range(300, 308, 1)))
+
+		composed = first.compose(second)
+		inverted = first.invert()
+		for p in range(16):
+			with self.subTest(p=p):
+				self.assertEqual(lookupPoint(composed, p), lookupPoint(second, lookupPoint(first, p)))
+				self.assertEqual(lookupPoint(inverted, lookupPoint(first, p)), p)
+		self.assertEqual(tuple(el.index for el in first.invert().invert().tree), tuple(el.index for el in first.tree))
+
+		with self.assertRaisesRegex(ValueError, "composition is empty"):
+			first.compose(SliceSequence(index=range(50, 60), data=range(0, 10)))
+
+
+class VizTests(unittest.TestCase):
+	def testScaled(self):
+		ranges = (range(0, 10), range(5, 15), slice(20, 10, -1), range(30, 40))
+		self.assertEqual(svizScaled(ranges, 40), "\n".join((
+			"[~~~~~~~~> <~~~~~~~~]         [~~~~~~~~>",
+			"     [~~~~~~~~>",
+			"|.........|.........|.........|.........",
+			"0         10        20        30",
+		)))
+		self.assertEqual(svizScaled(ranges, 20).splitlines()[0], "[~~~><~~~~]    [~~~>")
+
+		many = [range(i * 1000, i * 1000 + 1500) for i in range(1000)]
+		lines = svizScaled(many, 60, maxLanes=4).splitlines()
+		self.assertEqual(len(lines), 6)
+		self.assertTrue(all(len(l) <= 60 for l in lines))
+		self.assertEqual(svizScaled(()), "\n")
+
+	def testSVG(self):
+		import xml.etree.ElementTree as ET
+
+		ranges = [range(i * 10 ** 9, i * 10 ** 9 + 7 * 10 ** 8) for i in range(100)] + [range(5 * 10 ** 9, 10 ** 9, -1)]
+		chunks = svizSVG_(ranges, width=500)
+		self.assertFalse(isinstance(chunks, str))
+		root = ET.fromstring("".join(chunks))
+		rects = root.findall("{http://www.w3.org/2000/svg}rect")
+		self.assertEqual(len(rects), len(ranges))
+		self.assertTrue(all(int(r.get("x")) + int(r.get("width")) <= 500 for r in rects))
+		self.assertEqual(sum(r.get("class") == "n" for r in rects), 1)
+
+
+class PartitionedTests(unittest.TestCase):
+	def testScatterGather(self):
+		index = tuple(range(i, i + 4) for i in range(0, 128, 4))
+		data = tuple(range(i, i + 4) for i in range(1000, 1128, 4))
+		tree = RangesTree.build(index=index, data=data)
+		queries = (range(0, 4), range(3, 9), range(30, 70), range(0, 128), range(126, 200), range(200, 300), 66)
+
+		with PartitionedRangesIndex(index, data, shardsCount=4) as pi:
+			self.assertEqual(len(pi), len(index))
+			self.assertEqual(pi.bounds, [(0, 32), (32, 64), (64, 96), (96, 128)])
+			self.assertEqual(pi.shardsFor(range(30, 70)), [0, 1, 2])
+			self.assertEqual(pi.shardsFor(range(200, 300)), [])
+			self.assertEqual(tuple(pi.get(range(0, 128), merge=True)), (ValueLeaf(range(0, 128), range(1000, 1128)),))
+			for q in queries:
+				with self.subTest(q=q):
+					self.assertEqual(tuple(pi[q]), tuple(tree[q]))
+					if not isinstance(q, int) and tuple(tree[q]):
+						self.assertEqual(tuple(pi.get(q, merge=True)), tuple(mergeRangesInTreeLookupResult(tuple(tree[q]))))
+
+		with self.assertRaises(ValueError):
+			tuple(pi[range(0, 4)])
+
+		with self.assertRaisesRegex(ValueError, "empty index"):
+			PartitionedRangesIndex((), shardsCount=2)
+
+
+class InteropTests(unittest.TestCase):
+	ranges = (range(0, 4), range(4, 9), range(12, 16), range(20, 30), range(40, 41))
+
+	@unittest.skipUnless(pandas, "pandas is not installed")
+	def testPandas(self):
+		ii = pandas.IntervalIndex.from_arrays([0, 4, 12, 20, 40], [4, 9, 16, 30, 41], closed="left")
+		cols = fromIntervalIndex(ii)
+		self.assertEqual(tuple(cols), self.ranges)
+		self.assertTrue(numpy.shares_memory(cols.starts, ii.left.to_numpy()))
+		self.assertEqual(tuple(cols[1:3]), self.ranges[1:3])
+
+		self.assertEqual(tuple(fromIntervalIndex(pandas.IntervalIndex.from_arrays([-1, 3], [3, 8], closed="right"))), (range(0, 4), range(4, 9)))
+		self.assertEqual(tuple(fromIntervalIndex(pandas.IntervalIndex.from_arrays([0, 4], [3, 8], closed="both"))), (range(0, 4), range(4, 9)))
+
+		self.assertTrue(toIntervalIndex(self.ranges).equals(ii))
+		self.assertTrue(toIntervalIndex(cols).equals(ii))
+		self.assertTrue(toIntervalIndex((range(3, -1, -1),)).equals(pandas.IntervalIndex.from_arrays([0], [4], closed="left")))
+
+		t = RangesTree.build(index=ii, data=tuple(range(el.start + 100, el.stop + 100) for el in self.ranges))
+		self.assertEqual(tuple(t.keys()), self.ranges)
+		self.assertEqual(tuple(t[range(5, 13)]), (ValueLeaf(range(4, 9), range(104, 109)), ValueLeaf(range(12, 16), range(112, 116))))
+		self.assertEqual(OffsetIndex(ii).locate(10), (2, 13))
+
+	@unittest.skipUnless(pyarrow, "pyarrow is not installed")
+	def testArrow(self):
+		arr = toArrow(self.ranges)
+		self.assertEqual(arr.type.names, ["start", "stop", "step"])
+		self.assertEqual(tuple(fromArrow(arr, step="step")), self.ranges)
+		self.assertEqual(tuple(fromArrow(arr.slice(1, 2))), self.ranges[1:3])
+		self.assertEqual(tuple(fromArrow(pyarrow.chunked_array([arr.slice(0, 2), arr.slice(2)]))), self.ranges)
+
+		table = pyarrow.table({"start": [0, 4, 12, 20, 40], "stop": [4, 9, 16, 30, 41]})
+		cols = fromArrow(table)
+		self.assertEqual(tuple(cols), self.ranges)
+		self.assertEqual(toArrow(cols).field("stop").to_pylist(), [4, 9, 16, 30, 41])
+		self.assertEqual(tuple(fromArrowColumns(table.column("start"), table.column("stop"), tp=slice)), tuple(slice(el.start, el.stop) for el in self.ranges))
+
+		self.assertEqual(tuple(RangesTree.build(index=table).keys()), self.ranges)
+		self.assertEqual(tuple(RangesTree.build(index=arr).keys()), self.ranges)
+		self.assertEqual(tuple(GapIndex(range(0, 50), table).gaps()), (range(9, 12), range(16, 20), range(30, 40), range(41, 50)))
+
+		descending = fromArrow(pyarrow.table({"start": [5, 10], "stop": [0, 14]}))
+		self.assertEqual(tuple(descending), (range(5, 0, -1), range(10, 14)))
+		self.assertEqual(toArrow(descending).field("step").to_pylist(), [-1, 1])
+		self.assertEqual(tuple(fromArrow(toArrow(descending), step="step")), tuple(descending))
+		if pandas is not None:
+			self.assertTrue(toIntervalIndex(descending).equals(toIntervalIndex(tuple(descending))))
+
+
+class ProfilingTests(unittest.TestCase):
+	def testProfile(self) -> None:
+		from rangeslicetools import profiling
+		import rangeslicetools.diff
+
+		origSdiff = rangeslicetools.diff.sdiff
+		seq = SliceSequence(index=range(0, 16, 1), data=(range(0, 4, 1), range(4, 8, 1), range(8, 12, 1), range(12, 16, 1)))
+
+		with profiling.profile() as st:
+			tuple(seq[range(1, 15, 1)])
+			snormalize(range(5, 1, -1))
+
+		res = st.asDict()
+		self.assertEqual(res["queries"], 1)
+		self.assertEqual(res["total"]["leavesMatched"], 4)
+		self.assertEqual(res["total"]["sdiffInvocations"], 4)
+		self.assertEqual(res["calls"]["diff.sdiff"], 4)
+		self.assertGreaterEqual(res["calls"]["utils.snormalize"], 1)
+		self.assertGreater(res["total"]["nodesVisited"], 4)
+		self.assertIs(rangeslicetools.diff.sdiff, origSdiff)
+		self.assertIs(sdiff, origSdiff)
+
 
 if __name__ == "__main__":
 	unittest.main()